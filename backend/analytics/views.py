@@ -1,11 +1,19 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 from .models import ReadingPattern, ContentRecommendation, DocumentSimilarity
-from documents.models import Document, ReadingSession, ReadingAnalytics
-from documents.ai_processor import AIStoryTransformer
+from documents.models import AICallRecord, Document, IngestionJob, ReadingSession, ReadingAnalytics
+from documents.ai_cache import get_response_cache
+from documents.ai_context import ai_call_context
+from documents.ai_metrics import get_call_recorder, summarize_calls
+from documents.ai_provider import get_ai_transformer, provider_stats
+from documents.ai_resilience import AIUnavailableError, get_rate_limiter
+from documents.ai_scheduler import get_ai_scheduler
+from documents.views import ai_unavailable_response
 
 class AnalyticsViewSet(viewsets.ViewSet):
     
@@ -44,6 +52,35 @@ class AnalyticsViewSet(viewsets.ViewSet):
             'preferred_reading_times': pattern.preferred_times[:3]
         })
     
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def ai_metrics(self, request):
+        """AI call volume, latency, tokens and cost per prompt type over the last ?hours= (default 24)"""
+        try:
+            hours = float(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        get_call_recorder().flush()
+        records = AICallRecord.objects.filter(created_at__gte=timezone.now() - timedelta(hours=hours))
+        return Response({
+            'window_hours': hours,
+            **summarize_calls(records),
+            'response_cache': get_response_cache().stats(),
+            'provider': provider_stats(),
+            # Shared by every process: quota left, and whether bulk calls are holding off for interactive ones
+            'rate_limit': get_rate_limiter().stats(),
+            # Bulk work waiting in the DB queue, across all workers
+            'ingestion_queue': list(IngestionJob.objects.filter(
+                status__in=[IngestionJob.QUEUED, IngestionJob.RUNNING]
+            ).values('job_type', 'status').annotate(
+                jobs=Count('id'), users=Count('document__user', distinct=True)
+            ).order_by('job_type', 'status')),
+            # Slot queue depth and waits of this process's scheduler
+            'scheduler': get_ai_scheduler().stats(),
+            # Live per-tier p95 and routing decisions of this process's router
+            'model_tiers': get_ai_transformer().router.stats(),
+        })
+    
     @action(detail=False, methods=['get'])
     def discover(self, request):
         """Content discovery based on reading patterns"""
@@ -65,11 +102,14 @@ class AnalyticsViewSet(viewsets.ViewSet):
         # Generate AI recommendations
         try:
             user_interests = user.profile.interests
-            ai_transformer = AIStoryTransformer()
-            ai_recommendations = ai_transformer.generate_recommendations(
-                user_interests, 
-                list(completed_docs.values_list('title', flat=True)[:3])
-            )
+            ai_transformer = get_ai_transformer()
+            with ai_call_context(user_id=user.id):
+                ai_recommendations = ai_transformer.generate_recommendations(
+                    user_interests, 
+                    list(completed_docs.values_list('title', flat=True)[:3])
+                )
+        except AIUnavailableError as e:
+            return ai_unavailable_response(e)
         except:
             ai_recommendations = "Explore more documents to get personalized recommendations."
         
@@ -173,4 +173,130 @@ CORS_ALLOW_ALL_ORIGINS = True
 AUTH_USER_MODEL = 'users.User'
 
 # Google Generative AI Configuration
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
\ No newline at end of file
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+AI_BACKEND = os.getenv('AI_BACKEND', 'gemini')  # 'fake' = deterministic local model for offline load tests
+AI_FAKE_LATENCY_MS = float(os.getenv('AI_FAKE_LATENCY_MS', 200))  # mean (median for lognormal) per call
+AI_FAKE_LATENCY_JITTER_MS = float(os.getenv('AI_FAKE_LATENCY_JITTER_MS', 50))
+AI_FAKE_LATENCY_DISTRIBUTION = os.getenv('AI_FAKE_LATENCY_DISTRIBUTION', 'normal')  # fixed, uniform, normal, lognormal
+AI_FAKE_ERROR_RATE = float(os.getenv('AI_FAKE_ERROR_RATE', 0))  # fraction of calls failing with a 503
+AI_FAKE_TOKENS_PER_SECOND = float(os.getenv('AI_FAKE_TOKENS_PER_SECOND', 0))  # 0 = instant output
+AI_FAKE_OUTPUT_TOKENS = int(os.getenv('AI_FAKE_OUTPUT_TOKENS', 200))
+AI_FAKE_SEED = int(os.getenv('AI_FAKE_SEED', 0))
+# Per-tier fake latency, e.g. "fast=80,standard=400"; tiers left out use AI_FAKE_LATENCY_MS
+AI_FAKE_TIER_LATENCY_MS = {
+    tier: float(ms) for tier, ms in
+    (item.split('=', 1) for item in os.getenv('AI_FAKE_TIER_LATENCY_MS', '').split(',') if item)
+}
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', 20))  # keep-alive connections held by the shared client
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', 60))  # seconds
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', 4))  # in-flight model calls per ingestion job
+AI_ENHANCE_DEADLINE = float(os.getenv('AI_ENHANCE_DEADLINE', 20))  # seconds the enhance endpoint waits for its parts
+AI_STORY_BATCH_TOKENS = int(os.getenv('AI_STORY_BATCH_TOKENS', 0))  # >0 packs story sections into one request
+AI_STORY_BATCH_MAX_SECTIONS = int(os.getenv('AI_STORY_BATCH_MAX_SECTIONS', 8))
+
+STORY_GENERATION_MODE = os.getenv('STORY_GENERATION_MODE', 'eager')  # 'lazy' stores raw sections, stories made on demand
+STORY_PREFETCH_WINDOW = int(os.getenv('STORY_PREFETCH_WINDOW', 5))  # chunks generated ahead of the reader
+
+# Model tiers as "tier=model" pairs, fastest first. Each prompt type starts on its AI_TIER_ROUTES tier,
+# small prompts go to the fastest tier, and a tier whose recent p95 is over the SLO hands requests
+# to the next faster one
+AI_MODEL_TIERS = dict(
+    item.split('=', 1)
+    for item in os.getenv('AI_MODEL_TIERS', 'fast=gemini-2.5-flash-lite,standard=gemini-2.5-flash').split(',')
+)
+AI_DEFAULT_TIER = os.getenv('AI_DEFAULT_TIER', 'standard')
+AI_TIER_ROUTES = {
+    'story': 'standard',
+    'story_batch': 'standard',
+    'enhancement': 'standard',
+    'artifacts': 'standard',
+    'connection': 'fast',
+    'summary': 'fast',
+    'key_points': 'fast',
+    'questions': 'fast',
+    'recommendations': 'fast',
+    'reading_level': 'fast',
+}
+AI_TIER_SMALL_INPUT_TOKENS = int(os.getenv('AI_TIER_SMALL_INPUT_TOKENS', 200))  # a ~60-word story prompt
+AI_DEFAULT_LATENCY_SLO_MS = float(os.getenv('AI_DEFAULT_LATENCY_SLO_MS', 15000))  # 0 = no SLO fallback
+AI_LATENCY_SLO_MS = {  # interactive prompt types get tighter budgets
+    'enhancement': float(os.getenv('AI_ENHANCEMENT_SLO_MS', 8000)),
+    'connection': float(os.getenv('AI_CONNECTION_SLO_MS', 8000)),
+    'recommendations': float(os.getenv('AI_RECOMMENDATIONS_SLO_MS', 5000)),
+}
+AI_TIER_LATENCY_WINDOW = float(os.getenv('AI_TIER_LATENCY_WINDOW', 300))  # seconds of latency samples per tier
+AI_TIER_MIN_SAMPLES = int(os.getenv('AI_TIER_MIN_SAMPLES', 20))  # calls needed before a p95 is trusted
+
+# Shared quota (enforced across all processes on this machine), retries and circuit breaker
+AI_REQUESTS_PER_MINUTE = int(os.getenv('AI_REQUESTS_PER_MINUTE', 60))  # 0 = unlimited
+AI_TOKENS_PER_MINUTE = int(os.getenv('AI_TOKENS_PER_MINUTE', 250000))  # 0 = unlimited
+AI_EXPECTED_OUTPUT_TOKENS = int(os.getenv('AI_EXPECTED_OUTPUT_TOKENS', 400))
+AI_RATE_LIMIT_STATE_FILE = os.getenv('AI_RATE_LIMIT_STATE_FILE', '')  # default: <tmp>/readflow-ai-ratelimit.json
+AI_RATE_LIMIT_MAX_WAIT = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT', 10))  # seconds an interactive call may queue
+AI_INGESTION_MAX_WAIT = float(os.getenv('AI_INGESTION_MAX_WAIT', 300))  # seconds an ingestion call may queue
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 4))
+AI_RETRY_BASE_DELAY = float(os.getenv('AI_RETRY_BASE_DELAY', 1))
+AI_RETRY_MAX_DELAY = float(os.getenv('AI_RETRY_MAX_DELAY', 30))
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', 5))
+AI_CIRCUIT_RESET_TIMEOUT = float(os.getenv('AI_CIRCUIT_RESET_TIMEOUT', 60))
+
+# Priority: across processes, bulk (ingestion) calls leave part of the shared quota untouched and hold off
+# while an interactive call is waiting for it. Within a process, model calls get slots round-robin per user
+AI_BULK_RESERVE_FRACTION = float(os.getenv('AI_BULK_RESERVE_FRACTION', 0.2))  # shared quota bulk leaves untouched
+AI_SCHEDULER_MAX_IN_FLIGHT = int(os.getenv('AI_SCHEDULER_MAX_IN_FLIGHT', 8))  # model calls per process
+AI_SCHEDULER_INTERACTIVE_RESERVE = int(os.getenv('AI_SCHEDULER_INTERACTIVE_RESERVE', 2))  # slots bulk can't take
+
+# Per-call instrumentation (AICallRecord); prices are USD per 1K input / output tokens
+AI_METRICS_ENABLED = os.getenv('AI_METRICS_ENABLED', 'true').lower() == 'true'
+AI_METRICS_FLUSH_SIZE = int(os.getenv('AI_METRICS_FLUSH_SIZE', 50))
+AI_METRICS_FLUSH_INTERVAL = float(os.getenv('AI_METRICS_FLUSH_INTERVAL', 5))  # seconds
+AI_METRICS_RETENTION_DAYS = int(os.getenv('AI_METRICS_RETENTION_DAYS', 30))  # 0 = keep every record
+AI_METRICS_PRUNE_EVERY = int(os.getenv('AI_METRICS_PRUNE_EVERY', 20))  # flushes between retention sweeps
+AI_MODEL_PRICING = {
+    'gemini-2.5-flash-lite': (0.0001, 0.0004),
+    'gemini-2.5-flash': (0.0003, 0.0025),
+    'gemini-2.5-pro': (0.00125, 0.01),
+    'fake-model': (0, 0),
+}
+
+# Prompt/response cache: in-process LRU in front of a DB table
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() == 'true'
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv('AI_CACHE_MEMORY_ENTRIES', 512))
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 7 * 24 * 3600))  # seconds
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', 50000))
+AI_CACHE_MAX_BYTES = int(os.getenv('AI_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# Background ingestion queue (run workers with `python manage.py run_ingestion_workers`)
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 2))
+INGESTION_JOB_TIMEOUT = int(os.getenv('INGESTION_JOB_TIMEOUT', 600))  # seconds
+INGESTION_MAX_ATTEMPTS = int(os.getenv('INGESTION_MAX_ATTEMPTS', 3))
+INGESTION_RETRY_BACKOFF = int(os.getenv('INGESTION_RETRY_BACKOFF', 30))  # seconds, doubled per attempt
+INGESTION_POLL_INTERVAL = float(os.getenv('INGESTION_POLL_INTERVAL', 2))  # seconds
+# PDF page extraction (1 = sequential, >1 = process pool)
+# Backends: pdfplumber, pdfminer, pypdf. Compare them with `python manage.py benchmark_extraction <dir>`
+PDF_EXTRACTION_BACKEND = os.getenv('PDF_EXTRACTION_BACKEND', 'pdfplumber')
+PDF_EXTRACTION_LARGE_BACKEND = os.getenv('PDF_EXTRACTION_LARGE_BACKEND', '')  # used at or above the threshold
+PDF_EXTRACTION_LARGE_PAGE_THRESHOLD = int(os.getenv('PDF_EXTRACTION_LARGE_PAGE_THRESHOLD', 0))
+PDF_EXTRACTION_WORKERS = int(os.getenv('PDF_EXTRACTION_WORKERS', 1))
+PDF_EXTRACTION_BATCH_PAGES = int(os.getenv('PDF_EXTRACTION_BATCH_PAGES', 0))  # 0 = auto
+PDF_EXTRACTION_LOW_MEMORY = os.getenv('PDF_EXTRACTION_LOW_MEMORY', 'false').lower() == 'true'
+PDF_LOW_MEMORY_PAGE_THRESHOLD = int(os.getenv('PDF_LOW_MEMORY_PAGE_THRESHOLD', 500))  # pages, 0 = never automatic
+PDF_EXTRACTION_WINDOW_PAGES = int(os.getenv('PDF_EXTRACTION_WINDOW_PAGES', 50))
+PDF_EXTRACTION_MEMORY_CEILING_MB = int(os.getenv('PDF_EXTRACTION_MEMORY_CEILING_MB', 0))  # 0 = no ceiling
+
+# Lines on more than this fraction of pages are dropped as headers/footers before chunking (0 = off)
+BOILERPLATE_THRESHOLD = float(os.getenv('BOILERPLATE_THRESHOLD', 0.7))
+BOILERPLATE_MIN_PAGES = int(os.getenv('BOILERPLATE_MIN_PAGES', 8))  # shorter documents are left alone
+BOILERPLATE_MAX_LINE_CHARS = int(os.getenv('BOILERPLATE_MAX_LINE_CHARS', 200))
+BOILERPLATE_SAMPLE_PAGES = int(os.getenv('BOILERPLATE_SAMPLE_PAGES', 20))  # leading pages fingerprinted, 0 = all
+
+# Generate summary, key points, questions and a rewrite for every chunk after ingestion. Costs at least one
+# model call per chunk, so it is off by default (POST /documents/<id>/artifacts/ queues it per document)
+CHUNK_ARTIFACTS_AT_INGESTION = os.getenv('CHUNK_ARTIFACTS_AT_INGESTION', 'false').lower() == 'true'
+
+# Document summaries: per-chunk summaries merged SUMMARY_FAN_IN at a time
+SUMMARY_FAN_IN = int(os.getenv('SUMMARY_FAN_IN', 8))
+SUMMARY_CHUNK_WORDS = int(os.getenv('SUMMARY_CHUNK_WORDS', 80))
+
+CHUNK_BATCH_SIZE = int(os.getenv('CHUNK_BATCH_SIZE', 20))  # chunks per bulk insert
+CHUNK_FLUSH_INTERVAL = float(os.getenv('CHUNK_FLUSH_INTERVAL', 2))  # seconds before a partial batch is flushed
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+import httpx
+from django.conf import settings
+from google import genai
+from google.genai import types
+
+
+# Token counts are None when the backend does not report usage
+GenerationResult = namedtuple('GenerationResult', ['text', 'input_tokens', 'output_tokens'])
+
+
+class ModelBackend:
+    """Interface for text generation models used by AIStoryTransformer"""
+    name = None
+    model_name = None
+
+    def generate(self, prompt):
+        """Return a GenerationResult for a prompt"""
+        raise NotImplementedError
+
+    def generate_stream(self, prompt):
+        """Yield response text pieces as they arrive"""
+        yield self.generate(prompt).text
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini through one pooled, keep-alive google-genai client"""
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-2.5-flash', client=None):
+        self.model_name = model_name
+        # Model tiers share one client, and with it one connection pool
+        self.client = client or self.create_client()
+
+    @staticmethod
+    def create_client():
+        pool_size = getattr(settings, 'AI_HTTP_POOL_SIZE', 20)
+        return genai.Client(
+            api_key=settings.GEMINI_API_KEY,
+            http_options=types.HttpOptions(
+                timeout=int(getattr(settings, 'AI_REQUEST_TIMEOUT', 60) * 1000),  # milliseconds
+                client_args={'limits': httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size
+                )},
+            ),
+        )
+
+    def generate(self, prompt):
+        response = self.client.models.generate_content(model=self.model_name, contents=prompt)
+        usage = getattr(response, 'usage_metadata', None)
+        return GenerationResult(
+            (response.text or '').strip(),
+            getattr(usage, 'prompt_token_count', None),
+            getattr(usage, 'candidates_token_count', None),
+        )
+
+    def generate_stream(self, prompt):
+        for chunk in self.client.models.generate_content_stream(model=self.model_name, contents=prompt):
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackendError(Exception):
+    """Injected failure; carries a 503 code so it is retried like a real outage"""
+    code = 503
+
+
+FAKE_VOCABULARY = (
+    'story', 'reader', 'journey', 'idea', 'example', 'discovery', 'pattern', 'insight', 'chapter',
+    'question', 'answer', 'signal', 'method', 'result', 'lesson', 'practice', 'context', 'detail',
+    'imagine', 'notice', 'connect', 'explore', 'build', 'compare', 'explain', 'reveal', 'follow',
+    'quietly', 'suddenly', 'clearly', 'carefully', 'the', 'a', 'of', 'and', 'to', 'in', 'with',
+)
+
+
+class FakeBackend(ModelBackend):
+    """Deterministic local stand-in for load testing without a key or network.
+
+    The same prompt always produces the same text. Latency, failures and
+    token throughput are simulated from the configured distribution.
+    """
+    name = 'fake'
+
+    def __init__(self, latency_ms=200, latency_jitter_ms=50, latency_distribution='normal',
+                 error_rate=0.0, tokens_per_second=0, output_tokens=200, seed=0, model_name='fake-model'):
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_distribution = latency_distribution
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        """Seconds of time-to-first-token for one call"""
+        with self._lock:
+            if self.latency_distribution == 'fixed':
+                latency = self.latency_ms
+            elif self.latency_distribution == 'uniform':
+                latency = self._random.uniform(self.latency_ms - self.latency_jitter_ms,
+                                               self.latency_ms + self.latency_jitter_ms)
+            elif self.latency_distribution == 'lognormal':
+                # Long right tail like real model latency; latency_ms is the median
+                sigma = self.latency_jitter_ms / self.latency_ms if self.latency_ms else 0
+                latency = self.latency_ms * math.exp(self._random.gauss(0, sigma))
+            else:
+                latency = self._random.gauss(self.latency_ms, self.latency_jitter_ms)
+            return max(0.0, latency) / 1000
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def generate(self, prompt):
+        text = ''.join(self.generate_stream(prompt))
+        return GenerationResult(text, max(1, len(prompt) // 4), len(text.split()))
+
+    def generate_stream(self, prompt):
+        time.sleep(self.sample_latency())
+        if self.should_fail():
+            raise FakeBackendError('Injected fake backend failure')
+
+        text = self.render(prompt)
+        # Pace output at tokens_per_second, one word (~one token) per piece
+        delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        words = text.split(' ')
+        for index, word in enumerate(words):
+            if delay:
+                time.sleep(delay)
+            yield word if index == len(words) - 1 else word + ' '
+
+    def render(self, prompt):
+        """Deterministic response text, shaped like what the prompt asks for"""
+        template = re.search(r'JSON object shaped like\n(\{.*\})\n', prompt)
+        if template:
+            # Fill every field of the requested object: strings get a sentence, lists three
+            fields = json.loads(template.group(1))
+            return json.dumps({
+                key: [self.words(f'{prompt}:{key}:{i}', 12) for i in range(3)] if isinstance(value, list)
+                else self.words(f'{prompt}:{key}', self.output_tokens)
+                for key, value in fields.items()
+            })
+        sections = re.findall(r'### SECTION (\d+) ###', prompt)
+        if sections:
+            # Batched story prompts expect a JSON array of {id, story}
+            return json.dumps([
+                {'id': int(section), 'story': self.words(f'{prompt}:{section}', self.output_tokens)}
+                for section in sections
+            ])
+        return self.words(prompt, self.output_tokens)
+
+    def words(self, seed_text, count):
+        digest = hashlib.sha256(seed_text.encode('utf-8')).digest()
+        rng = random.Random(digest)
+        return ' '.join(rng.choice(FAKE_VOCABULARY) for _ in range(count)).capitalize() + '.'
+
+
+def get_model_backend(name=None, model_name=None, client=None, latency_ms=None):
+    """Build the model backend selected by AI_BACKEND"""
+    name = name or getattr(settings, 'AI_BACKEND', 'gemini')
+    if name == GeminiBackend.name:
+        return GeminiBackend(model_name or 'gemini-2.5-flash', client)
+    if name == FakeBackend.name:
+        return FakeBackend(
+            latency_ms=latency_ms if latency_ms is not None else getattr(settings, 'AI_FAKE_LATENCY_MS', 200),
+            latency_jitter_ms=getattr(settings, 'AI_FAKE_LATENCY_JITTER_MS', 50),
+            latency_distribution=getattr(settings, 'AI_FAKE_LATENCY_DISTRIBUTION', 'normal'),
+            error_rate=getattr(settings, 'AI_FAKE_ERROR_RATE', 0.0),
+            tokens_per_second=getattr(settings, 'AI_FAKE_TOKENS_PER_SECOND', 0),
+            output_tokens=getattr(settings, 'AI_FAKE_OUTPUT_TOKENS', 200),
+            seed=getattr(settings, 'AI_FAKE_SEED', 0),
+            model_name=model_name or 'fake-model',
+        )
+    raise ValueError(f"Unknown AI backend '{name}'")
+
+
+def get_model_tiers(name=None):
+    """One backend per AI_MODEL_TIERS entry, fastest tier first.
+
+    Fake tiers are named fake-<tier> and take their latency from
+    AI_FAKE_TIER_LATENCY_MS, so routing can be exercised offline.
+    """
+    name = name or getattr(settings, 'AI_BACKEND', 'gemini')
+    tiers = getattr(settings, 'AI_MODEL_TIERS', {'standard': 'gemini-2.5-flash'})
+    if name == GeminiBackend.name:
+        client = GeminiBackend.create_client()
+        return {tier: get_model_backend(name, model_name, client) for tier, model_name in tiers.items()}
+    fake_latency = getattr(settings, 'AI_FAKE_TIER_LATENCY_MS', {})
+    return {
+        tier: get_model_backend(name, f'fake-{tier}', latency_ms=fake_latency.get(tier))
+        for tier in tiers
+    }
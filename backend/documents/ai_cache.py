@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import AIResponseCacheEntry
+
+
+class AIResponseCache:
+    """Two-tier prompt/response cache: an in-process LRU in front of a DB table.
+
+    Entries expire after ttl_seconds in both tiers. The DB tier is trimmed to
+    max_db_entries / max_db_bytes (least recently used first) every
+    evict_every stores rather than on every write.
+    """
+
+    def __init__(self, enabled=True, max_memory_entries=512, ttl_seconds=7 * 24 * 3600,
+                 max_db_entries=50000, max_db_bytes=200 * 1024 * 1024, evict_every=100):
+        self.enabled = enabled
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.max_db_bytes = max_db_bytes
+        self.evict_every = evict_every
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        return hashlib.sha256(f"{model_name}\x00{prompt}".encode('utf-8')).hexdigest()
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+            return self._counters[counter]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters['memory_entries'] = len(self._memory)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+        counters['hit_rate'] = round((lookups - counters['misses']) / lookups, 3) if lookups else 0.0
+        return counters
+
+    def get(self, model_name, prompt):
+        """Return the cached response or None"""
+        if not self.enabled:
+            return None
+        key = self.make_key(model_name, prompt)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > time.time():
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return response
+                del self._memory[key]
+
+        now = timezone.now()
+        try:
+            entry = AIResponseCacheEntry.objects.filter(key=key, expires_at__gt=now).only(
+                'response', 'expires_at'
+            ).first()
+        except DatabaseError as e:
+            # Like writes, a locked or failing DB tier only costs a cache miss
+            print(f"⚠️ AI cache read skipped: {e}")
+            entry = None
+        if entry is None:
+            self._count('misses')
+            return None
+
+        try:
+            AIResponseCacheEntry.objects.filter(key=key).update(hits=F('hits') + 1, last_accessed_at=now)
+        except DatabaseError as e:
+            print(f"⚠️ AI cache hit count skipped: {e}")
+        self._remember(key, entry.response, entry.expires_at.timestamp())
+        self._count('db_hits')
+        return entry.response
+
+    def set(self, model_name, prompt, response):
+        """Store a successful model response in both tiers"""
+        if not self.enabled:
+            return
+        key = self.make_key(model_name, prompt)
+        expires_at = timezone.now() + timedelta(seconds=self.ttl_seconds)
+
+        self._remember(key, response, expires_at.timestamp())
+        try:
+            AIResponseCacheEntry.objects.update_or_create(key=key, defaults={
+                'model_name': model_name,
+                'response': response,
+                'size': len(response.encode('utf-8')),
+                'expires_at': expires_at,
+                'last_accessed_at': timezone.now(),
+            })
+        except DatabaseError as e:
+            # The response is already in memory; losing the shared copy must not fail the AI call
+            print(f"⚠️ AI cache write skipped: {e}")
+            return
+
+        if self._count('stores') % self.evict_every == 0:
+            try:
+                self.evict()
+            except DatabaseError as e:
+                # Trimming is retried after the next evict_every stores
+                print(f"⚠️ AI cache eviction skipped: {e}")
+
+    def _remember(self, key, response, expires_at):
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def evict(self):
+        """Drop expired DB entries, then least recently used ones until under the limits"""
+        evicted, _ = AIResponseCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+
+        excess = AIResponseCacheEntry.objects.count() - self.max_db_entries
+        if excess > 0:
+            oldest = AIResponseCacheEntry.objects.order_by('last_accessed_at')
+            stale_ids = list(oldest.values_list('id', flat=True)[:excess])
+            evicted += AIResponseCacheEntry.objects.filter(id__in=stale_ids).delete()[0]
+
+        total_bytes = AIResponseCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+        if total_bytes > self.max_db_bytes:
+            stale_ids = []
+            oldest = AIResponseCacheEntry.objects.order_by('last_accessed_at')
+            for entry_id, size in oldest.values_list('id', 'size').iterator():
+                if total_bytes <= self.max_db_bytes:
+                    break
+                stale_ids.append(entry_id)
+                total_bytes -= size
+            evicted += AIResponseCacheEntry.objects.filter(id__in=stale_ids).delete()[0]
+
+        self._count('evictions', evicted)
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        AIResponseCacheEntry.objects.all().delete()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache instance configured from settings"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = AIResponseCache(
+                    enabled=getattr(settings, 'AI_CACHE_ENABLED', True),
+                    max_memory_entries=getattr(settings, 'AI_CACHE_MEMORY_ENTRIES', 512),
+                    ttl_seconds=getattr(settings, 'AI_CACHE_TTL', 7 * 24 * 3600),
+                    max_db_entries=getattr(settings, 'AI_CACHE_MAX_ENTRIES', 50000),
+                    max_db_bytes=getattr(settings, 'AI_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+                )
+    return _response_cache
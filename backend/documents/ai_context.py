@@ -0,0 +1,18 @@
+import contextvars
+from contextlib import contextmanager
+
+_ai_context = contextvars.ContextVar('ai_context', default={})
+
+
+@contextmanager
+def ai_call_context(**values):
+    """Attach values (wait budget, document, priority...) to every AI call made inside the block"""
+    token = _ai_context.set({**_ai_context.get(), **values})
+    try:
+        yield
+    finally:
+        _ai_context.reset(token)
+
+
+def get_ai_context(key, default=None):
+    return _ai_context.get().get(key, default)
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+from .ai_context import get_ai_context
+from .models import AICallRecord
+
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    """USD cost from AI_MODEL_PRICING (per 1K input and output tokens); unknown models cost 0"""
+    input_price, output_price = getattr(settings, 'AI_MODEL_PRICING', {}).get(model_name, (0, 0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+
+class AICallRecorder:
+    """Buffers AICallRecord rows and writes them in bulk.
+
+    Rows are flushed once flush_size have accumulated or flush_interval
+    seconds have passed, and whenever flush() is called (e.g. after a job).
+    Every prune_every flushes, rows older than retention_days are deleted
+    so the table doesn't grow without bound.
+    """
+
+    def __init__(self, enabled=True, flush_size=50, flush_interval=5, retention_days=30, prune_every=20):
+        self.enabled = enabled
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.prune_every = prune_every
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._flushes = 0
+        self._lock = threading.Lock()
+
+    def record(self, prompt_type, model_name, outcome, latency_seconds, input_tokens=0, output_tokens=0,
+               tier='', route_reason=''):
+        if not self.enabled:
+            return
+        record = AICallRecord(
+            prompt_type=prompt_type,
+            model_name=model_name,
+            tier=tier,
+            route_reason=route_reason,
+            outcome=outcome,
+            cache_hit=outcome == AICallRecord.CACHE_HIT,
+            latency_ms=latency_seconds * 1000,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost_usd=estimate_cost(model_name, input_tokens, output_tokens),
+            # Ingestion jobs and chunk views put the document on the call context
+            document_id=get_ai_context('document_id'),
+        )
+        with self._lock:
+            self._buffer.append(record)
+            due = (len(self._buffer) >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if records:
+                self._flushes += 1
+            prune_due = bool(records) and self.retention_days > 0 and self._flushes % self.prune_every == 0
+        if not records:
+            return
+        try:
+            AICallRecord.objects.bulk_create(records)
+        except DatabaseError as e:
+            # Metrics must never fail the call they describe
+            print(f"⚠️ Dropped {len(records)} AI call records: {e}")
+        if prune_due:
+            try:
+                self.prune()
+            except DatabaseError as e:
+                # Retried after the next prune_every flushes
+                print(f"⚠️ AI call record pruning skipped: {e}")
+
+    def prune(self):
+        """Delete records older than retention_days, returns how many were removed"""
+        cutoff = timezone.now() - timedelta(days=self.retention_days)
+        deleted, _ = AICallRecord.objects.filter(created_at__lt=cutoff).delete()
+        return deleted
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_call_recorder():
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = AICallRecorder(
+                    enabled=getattr(settings, 'AI_METRICS_ENABLED', True),
+                    flush_size=getattr(settings, 'AI_METRICS_FLUSH_SIZE', 50),
+                    flush_interval=getattr(settings, 'AI_METRICS_FLUSH_INTERVAL', 5),
+                    retention_days=getattr(settings, 'AI_METRICS_RETENTION_DAYS', 30),
+                    prune_every=getattr(settings, 'AI_METRICS_PRUNE_EVERY', 20),
+                )
+    return _recorder
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+
+def summarize_calls(records):
+    """Per prompt type and overall aggregates for a queryset of AICallRecord"""
+    rows = records.values('prompt_type').annotate(
+        calls=Count('id'),
+        cache_hits=Count('id', filter=Q(cache_hit=True)),
+        fallbacks=Count('id', filter=Q(outcome=AICallRecord.FALLBACK)),
+        errors=Count('id', filter=Q(outcome__in=[AICallRecord.ERROR, AICallRecord.UNAVAILABLE])),
+        avg_latency_ms=Avg('latency_ms', filter=Q(cache_hit=False)),
+        input_tokens=Sum('input_tokens'),
+        output_tokens=Sum('output_tokens'),
+        cost_usd=Sum('cost_usd'),
+    ).order_by('-cost_usd', '-calls')
+
+    by_prompt_type = []
+    for row in rows:
+        latencies = records.filter(prompt_type=row['prompt_type'], cache_hit=False).values_list(
+            'latency_ms', flat=True
+        )
+        latencies = list(latencies)
+        row['avg_latency_ms'] = round(row['avg_latency_ms'] or 0, 1)
+        row['p95_latency_ms'] = round(percentile(latencies, 0.95), 1)
+        row['total_latency_ms'] = round(sum(latencies), 1)
+        row['cost_usd'] = round(row['cost_usd'] or 0, 6)
+        row['cache_hit_rate'] = round(row['cache_hits'] / row['calls'], 3) if row['calls'] else 0
+        by_prompt_type.append(row)
+
+    # Per tier and routing reason, to tune AI_TIER_ROUTES and the latency SLOs
+    by_tier = []
+    for row in records.exclude(tier='').values('tier', 'model_name', 'route_reason').annotate(
+        calls=Count('id'), cost_usd=Sum('cost_usd'),
+    ).order_by('tier', 'route_reason'):
+        latencies = list(records.filter(
+            tier=row['tier'], model_name=row['model_name'], route_reason=row['route_reason'], cache_hit=False
+        ).values_list('latency_ms', flat=True))
+        row['p50_latency_ms'] = round(percentile(latencies, 0.5), 1)
+        row['p95_latency_ms'] = round(percentile(latencies, 0.95), 1)
+        row['cost_usd'] = round(row['cost_usd'] or 0, 6)
+        by_tier.append(row)
+
+    totals = records.aggregate(
+        calls=Count('id'),
+        cache_hits=Count('id', filter=Q(cache_hit=True)),
+        fallbacks=Count('id', filter=Q(outcome=AICallRecord.FALLBACK)),
+        errors=Count('id', filter=Q(outcome__in=[AICallRecord.ERROR, AICallRecord.UNAVAILABLE])),
+        input_tokens=Sum('input_tokens'),
+        output_tokens=Sum('output_tokens'),
+        cost_usd=Sum('cost_usd'),
+    )
+    totals['input_tokens'] = totals['input_tokens'] or 0
+    totals['output_tokens'] = totals['output_tokens'] or 0
+    totals['cost_usd'] = round(totals['cost_usd'] or 0, 6)
+    return {'by_prompt_type': by_prompt_type, 'by_tier': by_tier, 'totals': totals}
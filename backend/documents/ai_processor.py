@@ -1,34 +1,117 @@
-from google import genai
 from django.conf import settings
+import hashlib
+import itertools
+import json
 import re
+import time
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
+from .ai_backends import get_model_tiers
+from .ai_cache import get_response_cache
+from .ai_context import get_ai_context
+from .ai_resilience import (AIUnavailableError, call_with_retries, get_circuit_breaker,
+                            get_rate_limiter, is_retryable_error)
+from .ai_scheduler import BULK, INTERACTIVE, get_ai_scheduler
+from .ai_metrics import get_call_recorder
+from .model_router import create_model_router
+from .models import AICallRecord
+from .story_store import find_stored_story, store_story
 
 class AIStoryTransformer:
-    def __init__(self):
+    # Bump when the enhancement or connection prompts change so stored enhancements are regenerated
+    ENHANCEMENT_PROMPT_VERSION = 1
+    # Same for the story prompt and the shared StoryTransformation store
+    STORY_PROMPT_VERSION = 1
+    # And for the summary prompts, whose partial results are kept on chunks and in Document.metadata
+    SUMMARY_PROMPT_VERSION = 1
+    # And for the multi-output prompt whose results are stored in ContentChunk.artifacts
+    ARTIFACT_PROMPT_VERSION = 1
+    
+    def __init__(self, backend=None, router=None):
         print("🚀 Initializing Google Gemini AI...")
-        # The configuration method remains the same
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        # The model initialization remains the same
-        self.model = genai.GenerativeModel('gemini-2.5-flash') # Recommended update to a current model
-        print("✅ Gemini AI ready!")
-    
-    def transform_to_story(self, text, user_interests, reading_level='casual'):
-        """Transform plain text into engaging story using Gemini"""
+        started = time.perf_counter()
+        # Gemini by default; AI_BACKEND=fake swaps in deterministic local models for load tests.
+        # A backend passed in directly is the only tier.
+        if router is None:
+            router = create_model_router({'default': backend} if backend is not None else get_model_tiers())
+        self.router = router
+        self.backend = router.tiers[router.default_tier]
+        self.model_name = self.backend.model_name
+        models = ', '.join(f"{tier}={tier_backend.model_name}" for tier, tier_backend in router.tiers.items())
+        print(f"✅ Gemini AI ready! ({models}, {(time.perf_counter() - started) * 1000:.0f} ms)")
+    
+    def transform_to_story(self, text, user_interests, reading_level='casual', use_store=True):
+        """Transform plain text into engaging story using Gemini, reusing stories other readers already got.
+        
+        use_store=False neither reads nor writes the shared StoryTransformation store.
+        """
         cleaned_text = self.clean_text(text)
+        key = self.story_key(cleaned_text, user_interests, reading_level)
+        if use_store:
+            story_content = self.find_story(key)
+            if story_content is not None:
+                return story_content
+        
         prompt = self.create_story_prompt(cleaned_text, user_interests, reading_level)
-        story_content = self.generate_with_gemini(prompt)
+        story_content = self.generate_with_gemini(prompt, prompt_type=AICallRecord.STORY)
+        if use_store and story_content != self.create_fallback():
+            store_story(key, story_content)
         return story_content
     
+    def transform_sections_batch(self, sections, user_interests, reading_level='casual'):
+        """Transform several sections with one Gemini request, falling back to single calls per item"""
+        cleaned = [self.clean_text(section) for section in sections]
+        keys = [self.story_key(text, user_interests, reading_level) for text in cleaned]
+        stories = [self.find_story(key) for key in keys]
+        missing = [i for i, story in enumerate(stories) if story is None]
+        
+        if len(missing) > 1:
+            prompt = self.create_batch_story_prompt([cleaned[i] for i in missing], user_interests, reading_level)
+            generated = self.parse_batch_response(
+                self.generate_with_gemini(prompt, prompt_type=AICallRecord.STORY_BATCH), len(missing)
+            )
+            for i, story in zip(missing, generated):
+                if story:
+                    stories[i] = story
+                    store_story(keys[i], story)
+        
+        # Any section the batch response did not cover gets its own request
+        return [
+            story if story else self.transform_to_story(section, user_interests, reading_level)
+            for section, story in zip(sections, stories)
+        ]
+    
+    def find_story(self, key):
+        """Story from the shared store, or None; served stories are recorded as cache hits"""
+        started = time.perf_counter()
+        story_content = find_stored_story(key)
+        if story_content is not None:
+            self.record_call(AICallRecord.STORY, AICallRecord.CACHE_HIT, started)
+        return story_content
+    
+    def story_key(self, cleaned_text, user_interests, reading_level):
+        """Everything create_story_prompt depends on, so equal keys mean equal prompts"""
+        return {
+            'section_hash': hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest(),
+            'primary_interest': user_interests[0] if user_interests else 'general',
+            'reading_level': reading_level,
+            'prompt_version': self.STORY_PROMPT_VERSION,
+        }
+    
+    def estimate_tokens(self, text):
+        """Rough token estimate (about 4 characters per token for English)"""
+        return max(1, len(text) // 4)
+    
     def add_contextual_enhancements(self, text, user_interests, reading_level='casual'):
         """Add contextual explanations and real-world examples"""
         prompt = self.create_enhancement_prompt(text, user_interests, reading_level)
-        enhanced_content = self.generate_with_gemini(prompt)
+        enhanced_content = self.generate_with_gemini(prompt, prompt_type=AICallRecord.ENHANCEMENT)
         return enhanced_content
     
     def highlight_connections(self, text, user_interests):
         """Highlight connections to user's interests"""
         prompt = self.create_connection_prompt(text, user_interests)
-        connections = self.generate_with_gemini(prompt)
+        connections = self.generate_with_gemini(prompt, prompt_type=AICallRecord.CONNECTION)
         return connections
     
     def clean_text(self, text):
@@ -57,6 +140,120 @@ Transformed story:"""
         
         return prompt
     
+    def create_batch_story_prompt(self, texts, interests, reading_level):
+        """Create one prompt that transforms several sections, answered as JSON"""
+        primary_interest = interests[0] if interests else 'general'
+        sections = "\n\n".join(f"### SECTION {i} ###\n{text}" for i, text in enumerate(texts))
+        
+        prompt = f"""Transform each of the following {len(texts)} text sections into an engaging, narrative story format suitable for {reading_level} reading level with focus on {primary_interest}.
+        
+For every section make it:
+- Conversational and engaging
+- Easy to understand
+- Maintain the core information
+- Add context and storytelling elements
+- Keep it concise (200-300 words)
+        
+Respond with only a JSON array containing one object per section, in order, shaped like
+[{{"id": 0, "story": "..."}}, {{"id": 1, "story": "..."}}]
+        
+{sections}
+        
+JSON:"""
+        
+        return prompt
+    
+    def parse_batch_response(self, response, expected):
+        """Split a batched JSON response into per-section stories (None where missing)"""
+        stories = [None] * expected
+        if response == self.create_fallback():
+            return stories
+        
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        try:
+            items = json.loads(match.group(0)) if match else []
+        except ValueError:
+            return stories
+        
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            index, story = item.get('id'), item.get('story')
+            if isinstance(index, int) and 0 <= index < expected and isinstance(story, str) and story.strip():
+                stories[index] = story.strip()
+        return stories
+    
+    def generate_chunk_artifacts(self, text, reading_level='casual', num_points=5, num_questions=3):
+        """Summary, key points, study questions and a reading-level rewrite from one Gemini request.
+        
+        Any field the structured response is missing is filled by its single-purpose prompt.
+        """
+        prompt = self.create_artifacts_prompt(text, reading_level, num_points, num_questions)
+        artifacts = self.parse_artifacts_response(
+            self.generate_with_gemini(prompt, prompt_type=AICallRecord.ARTIFACTS)
+        )
+        
+        single_prompts = {
+            'summary': lambda: self.generate_summary(text),
+            'key_points': lambda: self.split_list(self.extract_key_points(text, num_points)),
+            'questions': lambda: self.split_list(self.generate_questions(text, num_questions)),
+            'rewrite': lambda: self.adjust_reading_level(text, reading_level),
+        }
+        for field, generate in single_prompts.items():
+            if not artifacts.get(field):
+                artifacts[field] = generate()
+        return artifacts
+    
+    def create_artifacts_prompt(self, text, reading_level, num_points, num_questions):
+        """Create one prompt asking for every study artifact of a chunk, answered as JSON"""
+        prompt = f"""Read the text below and produce study material for a {reading_level} level reader:
+        
+- summary: a concise summary of 150 words or less
+- key_points: the {num_points} most important key points
+- questions: {num_questions} thought-provoking questions that help someone understand and engage with it
+- rewrite: the text rewritten for a {reading_level} level reader
+        
+Respond with only a JSON object shaped like
+{{"summary": "...", "key_points": ["..."], "questions": ["..."], "rewrite": "..."}}
+        
+Text: {text}
+        
+JSON:"""
+        
+        return prompt
+    
+    def parse_artifacts_response(self, response):
+        """Pull the artifact fields out of a JSON response, skipping anything malformed"""
+        if response == self.create_fallback():
+            return {}
+        
+        match = re.search(r'\{.*\}', response, re.DOTALL)
+        try:
+            data = json.loads(match.group(0)) if match else {}
+        except ValueError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        
+        artifacts = {}
+        for field in ('summary', 'rewrite'):
+            if isinstance(data.get(field), str) and data[field].strip():
+                artifacts[field] = data[field].strip()
+        for field in ('key_points', 'questions'):
+            items = data.get(field)
+            if isinstance(items, list):
+                items = [item.strip() for item in items if isinstance(item, str) and item.strip()]
+                if items:
+                    artifacts[field] = items
+        return artifacts
+    
+    def split_list(self, text):
+        """Turn a bulleted or numbered list response into a list of strings"""
+        if text == self.create_fallback():
+            return []
+        items = [re.sub(r'^\s*(?:[-*•]|\d+[.)])\s*', '', line).strip() for line in text.splitlines()]
+        return [item for item in items if item]
+    
     def create_enhancement_prompt(self, text, interests, reading_level):
         """Create prompt for contextual enhancements"""
         interests_str = ', '.join(interests[:3]) if interests else 'general'
@@ -92,16 +289,182 @@ Connections:"""
         
         return prompt
     
-    def generate_with_gemini(self, prompt):
-        """Generate content using Gemini API"""
+    def generate_with_gemini(self, prompt, use_cache=True, prompt_type=AICallRecord.OTHER):
+        """Generate content using Gemini API, serving repeated prompts from the response cache"""
+        started = time.perf_counter()
+        route = self.router.route(prompt_type, self.estimate_tokens(prompt))
+        cache = get_response_cache()
+        if use_cache:
+            cached = cache.get(route.backend.model_name, prompt)
+            if cached is not None:
+                self.record_call(prompt_type, AICallRecord.CACHE_HIT, started, route=route)
+                return cached
+        
+        breaker = get_circuit_breaker()
+        try:
+            breaker.before_call()
+        except AIUnavailableError:
+            self.record_call(prompt_type, AICallRecord.UNAVAILABLE, started, route=route)
+            raise
         try:
-            # The generate_content call remains the same
-            response = self.model.generate_content(prompt)
-            story_content = response.text.strip()
-            return story_content if story_content else self.create_fallback()
+            result = call_with_retries(
+                lambda: self.call_model(prompt, route),
+                max_retries=getattr(settings, 'AI_MAX_RETRIES', 4),
+                base_delay=getattr(settings, 'AI_RETRY_BASE_DELAY', 1.0),
+                max_delay=getattr(settings, 'AI_RETRY_MAX_DELAY', 30.0),
+            )
+        except AIUnavailableError:
+            # Our own rate limiter gave up waiting; that says nothing about the model's health
+            breaker.cancel_call()
+            self.record_call(prompt_type, AICallRecord.UNAVAILABLE, started, route=route)
+            raise
         except Exception as e:
+            if is_retryable_error(e):
+                # The model itself is failing: surface it instead of storing placeholder text
+                breaker.record_failure()
+                self.record_call(prompt_type, AICallRecord.ERROR, started, prompt, route=route)
+                raise AIUnavailableError(f'Gemini generation failed: {e}') from e
+            breaker.record_success()
             print(f"🤖 Gemini generation failed: {e}")
+            self.record_call(prompt_type, AICallRecord.FALLBACK, started, prompt, route=route)
             return self.create_fallback()
+        breaker.record_success()
+        
+        story_content = result.text
+        if not story_content:
+            self.record_call(prompt_type, AICallRecord.FALLBACK, started, prompt, result=result, route=route)
+            return self.create_fallback()
+        self.record_call(prompt_type, AICallRecord.SUCCESS, started, prompt, result=result, route=route)
+        
+        # Only real model output is cached, never the fallback text
+        if use_cache:
+            cache.set(route.backend.model_name, prompt, story_content)
+        return story_content
+    
+    def record_call(self, prompt_type, outcome, started, prompt=None, result=None, output_text=None, route=None):
+        """Record latency, tokens, outcome and routing of one generation; prompt=None means no tokens were sent"""
+        input_tokens = output_tokens = 0
+        if prompt is not None:
+            # Prefer the model's own usage counts, estimating whatever it didn't report
+            input_tokens = result.input_tokens if result and result.input_tokens is not None \
+                else self.estimate_tokens(prompt)
+            if result is not None:
+                output_text = result.text
+            if result and result.output_tokens is not None:
+                output_tokens = result.output_tokens
+            elif output_text:
+                output_tokens = self.estimate_tokens(output_text)
+        backend = route.backend if route else self.backend
+        get_call_recorder().record(
+            prompt_type, backend.model_name, outcome, time.perf_counter() - started, input_tokens, output_tokens,
+            tier=route.tier if route else '', route_reason=route.reason if route else '',
+        )
+    
+    def call_model(self, prompt, route):
+        """Single scheduled, rate-limited request to the routed model, returns a GenerationResult"""
+        with self.model_slot(prompt):
+            started = time.perf_counter()
+            result = route.backend.generate(prompt)
+        # Only the model's own time counts towards the tier's latency, not queueing for a slot
+        self.router.observe(route.tier, time.perf_counter() - started)
+        return result
+    
+    @contextmanager
+    def model_slot(self, prompt):
+        """Wait for a scheduler slot and quota for one request; the slot is held until the block exits"""
+        tokens = self.estimate_tokens(prompt) + getattr(settings, 'AI_EXPECTED_OUTPUT_TOKENS', 400)
+        max_wait = get_ai_context('max_wait', getattr(settings, 'AI_RATE_LIMIT_MAX_WAIT', 10))
+        # Calls are interactive unless the caller (e.g. an ingestion job) says otherwise
+        priority = get_ai_context('priority', INTERACTIVE)
+        deadline = time.monotonic() + max_wait
+        with get_ai_scheduler().slot(priority, get_ai_context('user_id'), max_wait):
+            # The quota is shared by web and worker processes: bulk work leaves part of it untouched
+            # and holds off while an interactive call anywhere is waiting for it
+            bulk = priority == BULK
+            reserve = getattr(settings, 'AI_BULK_RESERVE_FRACTION', 0.2) if bulk else 0.0
+            get_rate_limiter().acquire(tokens, max_wait=max(0.0, deadline - time.monotonic()),
+                                       reserve=reserve, bulk=bulk)
+            yield
+    
+    def stream_with_gemini(self, prompt, use_cache=True, prompt_type=AICallRecord.OTHER):
+        """Yield Gemini output as it arrives, caching the full text once the stream completes"""
+        started = time.perf_counter()
+        route = self.router.route(prompt_type, self.estimate_tokens(prompt))
+        cache = get_response_cache()
+        if use_cache:
+            cached = cache.get(route.backend.model_name, prompt)
+            if cached is not None:
+                self.record_call(prompt_type, AICallRecord.CACHE_HIT, started, route=route)
+                yield cached
+                return
+        
+        breaker = get_circuit_breaker()
+        try:
+            breaker.before_call()
+        except AIUnavailableError:
+            self.record_call(prompt_type, AICallRecord.UNAVAILABLE, started, route=route)
+            raise
+        parts = []
+        try:
+            # Only opening the stream is retried; once text has been sent it can't be taken back
+            stream = call_with_retries(
+                lambda: self.open_stream(prompt, route),
+                max_retries=getattr(settings, 'AI_MAX_RETRIES', 4),
+                base_delay=getattr(settings, 'AI_RETRY_BASE_DELAY', 1.0),
+                max_delay=getattr(settings, 'AI_RETRY_MAX_DELAY', 30.0),
+            )
+            for text in stream:
+                parts.append(text)
+                yield text
+        except AIUnavailableError:
+            breaker.cancel_call()
+            self.record_call(prompt_type, AICallRecord.UNAVAILABLE, started, route=route)
+            raise
+        except GeneratorExit:
+            # The client went away mid-stream; the partial text is neither cached nor counted as a failure
+            breaker.cancel_call()
+            raise
+        except Exception as e:
+            if is_retryable_error(e):
+                breaker.record_failure()
+                self.record_call(prompt_type, AICallRecord.ERROR, started, prompt,
+                                 output_text=''.join(parts), route=route)
+                raise AIUnavailableError(f'Gemini generation failed: {e}') from e
+            breaker.record_success()
+            print(f"🤖 Gemini streaming failed: {e}")
+            self.record_call(prompt_type, AICallRecord.FALLBACK, started, prompt,
+                             output_text=''.join(parts), route=route)
+            if not parts:
+                yield self.create_fallback()
+            return
+        breaker.record_success()
+        
+        text = ''.join(parts).strip()
+        outcome = AICallRecord.SUCCESS if text else AICallRecord.FALLBACK
+        self.record_call(prompt_type, outcome, started, prompt, output_text=text, route=route)
+        if not text:
+            yield self.create_fallback()
+        elif use_cache:
+            cache.set(route.backend.model_name, prompt, text)
+    
+    def open_stream(self, prompt, route):
+        """Scheduled, rate-limited streaming request to the routed model, returns an iterator of text pieces"""
+        with ExitStack() as stack:
+            stack.enter_context(self.model_slot(prompt))
+            started = time.perf_counter()
+            stream = iter(route.backend.generate_stream(prompt))
+            # Pull the first piece here so errors raised on connect happen inside the retry loop
+            first = next(stream, None)
+            slot = stack.pop_all()
+        stream = stream if first is None else itertools.chain([first], stream)
+        return self.release_after(stream, slot, route, started)
+    
+    def release_after(self, stream, slot, route, started):
+        """Keep the scheduler slot until the stream is exhausted or closed"""
+        with slot:
+            yield from stream
+            # A stream the client abandoned says nothing about how long the tier takes
+            self.router.observe(route.tier, time.perf_counter() - started)
     
     def create_fallback(self):
         """Simple fallback when AI fails"""
@@ -117,7 +480,7 @@ Connections:"""
         
 Recommendations:"""
         
-        return self.generate_with_gemini(prompt)
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.RECOMMENDATIONS)
     
     def generate_summary(self, text, max_length=150):
         """Generate concise summary of the text"""
@@ -127,7 +490,18 @@ Recommendations:"""
         
 Summary:"""
         
-        return self.generate_with_gemini(prompt)
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.SUMMARY)
+    
+    def combine_summaries(self, summaries, max_length=250):
+        """Merge consecutive partial summaries into one (the reduce step of document summarization)"""
+        parts = "\n\n".join(f"Part {i + 1}: {summary}" for i, summary in enumerate(summaries))
+        prompt = f"""These are summaries of consecutive parts of one document, in order. Combine them into a single coherent summary of {max_length} words or less that keeps the most important points:
+        
+{parts}
+        
+Combined summary:"""
+        
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.SUMMARY)
     
     def extract_key_points(self, text, num_points=5):
         """Extract key points from the text"""
@@ -137,7 +511,7 @@ Summary:"""
         
 Key Points:"""
         
-        return self.generate_with_gemini(prompt)
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.KEY_POINTS)
     
     def adjust_reading_level(self, text, target_level='casual'):
         """Adjust text complexity to match reading level"""
@@ -155,7 +529,7 @@ Key Points:"""
         
 Rewritten text:"""
         
-        return self.generate_with_gemini(prompt)
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.READING_LEVEL)
     
     def generate_questions(self, text, num_questions=3):
         """Generate thought-provoking questions about the content"""
@@ -165,4 +539,4 @@ Rewritten text:"""
         
 Questions:"""
         
-        return self.generate_with_gemini(prompt)
\ No newline at end of file
+        return self.generate_with_gemini(prompt, prompt_type=AICallRecord.QUESTIONS)
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import threading
+import time
+from .ai_processor import AIStoryTransformer
+
+_transformer = None
+_lock = threading.Lock()
+_stats = {'instances_created': 0, 'init_seconds': None, 'lookups': 0}
+
+
+def get_ai_transformer():
+    """Shared AIStoryTransformer for this process, created on first use.
+
+    The transformer is stateless apart from its SDK client, whose pooled
+    keep-alive connections are safe to share between threads.
+    """
+    global _transformer
+    with _lock:
+        _stats['lookups'] += 1
+        if _transformer is None:
+            started = time.perf_counter()
+            _transformer = AIStoryTransformer()
+            _stats['instances_created'] += 1
+            _stats['init_seconds'] = round(time.perf_counter() - started, 4)
+        return _transformer
+
+
+def reset_ai_transformer():
+    """Drop the shared client; the next lookup builds a fresh one"""
+    global _transformer
+    with _lock:
+        _transformer = None
+
+
+def provider_stats():
+    return dict(_stats)
+
+
+def _reset_after_fork():
+    """Drop the client in a forked child without touching the lock another parent thread may have held"""
+    global _transformer, _lock
+    _lock = threading.Lock()
+    _transformer = None
+
+
+# A forked child must not reuse the parent's open HTTP connections
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,238 @@
+import fcntl
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from django.conf import settings
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class AIUnavailableError(Exception):
+    """The model cannot be called right now (circuit open, quota exhausted or retries spent)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable_error(error):
+    """Transient failures worth retrying: throttling, server errors, timeouts and dropped connections"""
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    if code in RETRYABLE_STATUS_CODES:
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # httpx transport errors (used by the genai SDK) don't subclass the builtins above
+    return type(error).__module__.startswith('httpx')
+
+
+def call_with_retries(fn, max_retries, base_delay, max_delay):
+    """Call fn, retrying retryable errors with exponential backoff and full jitter"""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"⏳ Retryable AI error ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+class TokenBucketLimiter:
+    """Requests/min and tokens/min buckets shared by every thread and process on this machine.
+
+    The bucket state lives in a small JSON file guarded by flock, so separate
+    ingestion workers and web processes draw from the same quota.
+
+    Bulk callers (ingestion) come second in two ways. They pass a reserve, a
+    fraction of each bucket, and only draw while that much would be left
+    over. And while an interactive caller is waiting for quota, it records
+    how long it is waiting; bulk callers in every process hold off until
+    then, so the interactive call gets the next free request.
+    """
+    # Extra seconds bulk callers hold off, covering the interactive waiter's wake-up jitter
+    INTERACTIVE_HOLD_SLACK = 0.5
+
+    def __init__(self, requests_per_minute, tokens_per_minute, state_path):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.state_path = state_path
+        self._lock = threading.Lock()
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state['updated'])
+        if self.requests_per_minute:
+            state['requests'] = min(self.requests_per_minute,
+                                    state['requests'] + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            state['tokens'] = min(self.tokens_per_minute,
+                                  state['tokens'] + elapsed * self.tokens_per_minute / 60)
+        state['updated'] = now
+
+    def _read_state(self, f, now):
+        f.seek(0)
+        raw = f.read()
+        state = json.loads(raw) if raw else {
+            'requests': self.requests_per_minute, 'tokens': self.tokens_per_minute, 'updated': now,
+        }
+        self._refill(state, now)
+        return state
+
+    def try_acquire(self, tokens, reserve=0.0, bulk=False, hold_within=None):
+        """Take one request and `tokens` from the buckets; returns 0 or the seconds to wait.
+
+        A waiting interactive call (bulk=False) holds bulk callers back if its
+        wait is at most hold_within seconds, i.e. if it is going to wait it out.
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        with self._lock, open(self.state_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            now = time.time()
+            state = self._read_state(f, now)
+
+            waits = []
+            interactive_waiting_until = state.get('interactive_waiting_until', 0)
+            if bulk and interactive_waiting_until > now:
+                waits.append(interactive_waiting_until - now)
+            needed_requests = 1 + reserve * self.requests_per_minute
+            needed_tokens = tokens + reserve * self.tokens_per_minute
+            if self.requests_per_minute and state['requests'] < needed_requests:
+                waits.append((needed_requests - state['requests']) * 60 / self.requests_per_minute)
+            if self.tokens_per_minute and state['tokens'] < needed_tokens:
+                waits.append((needed_tokens - state['tokens']) * 60 / self.tokens_per_minute)
+
+            if not waits:
+                if self.requests_per_minute:
+                    state['requests'] -= 1
+                if self.tokens_per_minute:
+                    state['tokens'] -= tokens
+            elif not bulk and (hold_within is None or max(waits) <= hold_within):
+                state['interactive_waiting_until'] = max(
+                    interactive_waiting_until, now + max(waits) + self.INTERACTIVE_HOLD_SLACK
+                )
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+            return max(waits) if waits else 0
+
+    def acquire(self, tokens, max_wait, reserve=0.0, bulk=False):
+        """Block until the call fits in the quota; give up once the wait would exceed max_wait"""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            # A reserve must still leave room for the call itself
+            reserve = min(reserve, 1 - tokens / self.tokens_per_minute)
+        if self.requests_per_minute:
+            reserve = min(reserve, 1 - 1 / self.requests_per_minute)
+        reserve = max(0.0, reserve)
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire(tokens, reserve, bulk, hold_within=deadline - time.monotonic())
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise AIUnavailableError('AI rate limit reached', retry_after=wait)
+            time.sleep(wait + random.uniform(0, 0.1))  # jitter so waiters don't wake in lockstep
+
+    def stats(self):
+        """Current bucket levels and whether bulk callers are holding off for an interactive one"""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return {'enabled': False}
+        with self._lock, open(self.state_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            now = time.time()
+            state = self._read_state(f, now)
+        return {
+            'enabled': True,
+            'requests_available': round(state['requests'], 2),
+            'tokens_available': round(state['tokens']),
+            'interactive_waiting': state.get('interactive_waiting_until', 0) > now,
+        }
+
+
+class CircuitBreaker:
+    """Stops outbound calls after repeated failures, then lets one trial call through"""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise AIUnavailableError if calls are currently blocked"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise AIUnavailableError('AI service temporarily unavailable', retry_after=max(remaining, 1))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def cancel_call(self):
+        """The call never reached the model, so a pending trial slot is freed"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 AI circuit opened after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_rate_limiter = None
+_circuit_breaker = None
+_singleton_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _singleton_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucketLimiter(
+                requests_per_minute=getattr(settings, 'AI_REQUESTS_PER_MINUTE', 60),
+                tokens_per_minute=getattr(settings, 'AI_TOKENS_PER_MINUTE', 250000),
+                state_path=getattr(settings, 'AI_RATE_LIMIT_STATE_FILE', None)
+                or os.path.join(tempfile.gettempdir(), 'readflow-ai-ratelimit.json'),
+            )
+    return _rate_limiter
+
+
+def get_circuit_breaker():
+    global _circuit_breaker
+    with _singleton_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker(
+                failure_threshold=getattr(settings, 'AI_CIRCUIT_FAILURE_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'AI_CIRCUIT_RESET_TIMEOUT', 60),
+            )
+    return _circuit_breaker
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from django.conf import settings
+from .ai_resilience import AIUnavailableError
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITY_CLASSES = (INTERACTIVE, BULK)  # served in this order
+
+
+class _Ticket:
+    __slots__ = ('priority', 'user_key', 'enqueued_at', 'granted')
+
+    def __init__(self, priority, user_key):
+        self.priority = priority
+        self.user_key = user_key
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class AIScheduler:
+    """Hands out this process's model-call slots by priority class, then round-robin by user.
+
+    This caps concurrent model calls per process and, when they are all
+    busy, serves waiting users in turn, so one reader firing many requests
+    at a web process can't starve the others. The class order only matters
+    in a process that runs both kinds of work (e.g. a dev server draining
+    the queue in-process): a free slot goes to an interactive call first,
+    and bulk work may hold at most max_in_flight - interactive_reserve slots.
+    Between web and worker processes, priority is enforced by the shared
+    TokenBucketLimiter, and fairness between document owners by the order
+    workers claim jobs in.
+    """
+
+    def __init__(self, max_in_flight=8, interactive_reserve=2):
+        self.max_in_flight = max(1, max_in_flight)
+        self.bulk_limit = max(1, self.max_in_flight - interactive_reserve)
+        self._condition = threading.Condition()
+        # priority -> user_key -> deque of tickets; user order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_CLASSES}
+        self._in_flight = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._stats = {
+            priority: {'granted': 0, 'timed_out': 0, 'total_wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for priority in PRIORITY_CLASSES
+        }
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, user_key=None, max_wait=None):
+        """Hold one model-call slot for the duration of the block"""
+        priority = priority if priority in self._queues else INTERACTIVE
+        self.acquire(priority, user_key, max_wait)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def acquire(self, priority, user_key=None, max_wait=None):
+        ticket = _Ticket(priority, user_key)
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        with self._condition:
+            self._queues[priority].setdefault(user_key, deque()).append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._remove(ticket)
+                    self._stats[priority]['timed_out'] += 1
+                    raise AIUnavailableError('AI capacity busy', retry_after=1)
+                self._condition.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[priority]
+            stats['granted'] += 1
+            stats['total_wait_seconds'] += waited
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+
+    def release(self, priority):
+        with self._condition:
+            self._in_flight[priority] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to waiting tickets; caller holds the condition"""
+        granted = False
+        while sum(self._in_flight.values()) < self.max_in_flight:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._in_flight[ticket.priority] += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _next_ticket(self):
+        for priority in PRIORITY_CLASSES:
+            if priority == BULK and self._in_flight[BULK] >= self.bulk_limit:
+                continue
+            users = self._queues[priority]
+            if users:
+                # Take the first user's oldest ticket, then move that user to the back
+                user_key, tickets = next(iter(users.items()))
+                ticket = tickets.popleft()
+                del users[user_key]
+                if tickets:
+                    users[user_key] = tickets
+                return ticket
+        return None
+
+    def _remove(self, ticket):
+        users = self._queues[ticket.priority]
+        tickets = users.get(ticket.user_key)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del users[ticket.user_key]
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'bulk_limit': self.bulk_limit,
+                'classes': {
+                    priority: {
+                        'queued': sum(len(tickets) for tickets in self._queues[priority].values()),
+                        'queued_users': len(self._queues[priority]),
+                        'in_flight': self._in_flight[priority],
+                        **{key: round(value, 3) if isinstance(value, float) else value
+                           for key, value in self._stats[priority].items()},
+                        'avg_wait_seconds': round(
+                            self._stats[priority]['total_wait_seconds'] / self._stats[priority]['granted'], 3
+                        ) if self._stats[priority]['granted'] else 0,
+                    }
+                    for priority in PRIORITY_CLASSES
+                },
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_ai_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = AIScheduler(
+                    max_in_flight=getattr(settings, 'AI_SCHEDULER_MAX_IN_FLIGHT', 8),
+                    interactive_reserve=getattr(settings, 'AI_SCHEDULER_INTERACTIVE_RESERVE', 2),
+                )
+    return _scheduler
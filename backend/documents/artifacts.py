@@ -0,0 +1,62 @@
+import hashlib
+from django.conf import settings
+from django.utils import timezone
+from .ai_provider import get_ai_transformer
+from .concurrency import bounded_ordered_map
+from .models import ContentChunk
+
+ARTIFACT_FIELDS = ('summary', 'key_points', 'questions', 'rewrite')
+
+
+def artifact_key(chunk, reading_level):
+    """What the stored artifacts were generated from; a different key means they are stale"""
+    return {
+        'source_hash': hashlib.sha256(chunk.content.encode('utf-8')).hexdigest(),
+        'reading_level': reading_level,
+        'prompt_version': get_ai_transformer().ARTIFACT_PROMPT_VERSION,
+    }
+
+
+def is_current(chunk, key):
+    return all(chunk.artifacts.get(name) == value for name, value in key.items())
+
+
+def generate_chunk_artifacts(document, reading_level):
+    """Fill ContentChunk.artifacts for every chunk that lacks current ones, returns how many were stored.
+
+    Pending lazy story chunks are skipped: they get artifacts once their story
+    has been generated, instead of spending calls on the raw section.
+    """
+    ai_transformer = get_ai_transformer()
+    keys = {}
+    stale = []
+    for chunk in document.chunks.exclude(metadata__story_status='pending').order_by('chunk_index'):
+        keys[chunk.id] = artifact_key(chunk, reading_level)
+        if not is_current(chunk, keys[chunk.id]):
+            stale.append(chunk)
+
+    generate = lambda chunk: ai_transformer.generate_chunk_artifacts(
+        ai_transformer.clean_text(chunk.content), reading_level
+    )
+    fallback = ai_transformer.create_fallback()
+    batch_size = getattr(settings, 'CHUNK_BATCH_SIZE', 20)
+    stored = 0
+    updated = []
+    # Model calls run concurrently; rows are written here so only this thread touches the DB
+    for chunk, artifacts in bounded_ordered_map(generate, stale, getattr(settings, 'AI_MAX_CONCURRENCY', 4)):
+        # Anything that came back as fallback text is left for the next run instead of being stored
+        if any(not artifacts.get(field) or artifacts[field] == fallback for field in ARTIFACT_FIELDS):
+            continue
+        chunk.artifacts = {
+            **{field: artifacts[field] for field in ARTIFACT_FIELDS},
+            **keys[chunk.id],
+            'generated_at': timezone.now().isoformat(),
+        }
+        updated.append(chunk)
+        # Saved in batches so a job that times out keeps the chunks it already finished
+        if len(updated) >= batch_size:
+            ContentChunk.objects.bulk_update(updated, ['artifacts'])
+            stored += len(updated)
+            updated = []
+    ContentChunk.objects.bulk_update(updated, ['artifacts'])
+    return stored + len(updated)
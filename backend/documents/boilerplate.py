@@ -0,0 +1,82 @@
+import hashlib
+import re
+from collections import Counter
+
+DIGITS = re.compile(r'\d+')
+WHITESPACE = re.compile(r'\s+')
+# Page-number furniture: "12", "- 12 -", "12 / 40", "Page 3 of 40", "Annual Report | p. 3"
+PAGE_NUMBER = re.compile(
+    r'^[\W_]*\d+(\s*(/|of)\s*\d+)?[\W_]*$|\bp(age|g)?\.?\s*\d+(\s*(/|of)\s*\d+)?[\W_]*$',
+    re.IGNORECASE,
+)
+
+
+class BoilerplateDetector:
+    """Find lines repeated across pages (running headers, footers, copyright lines).
+
+    Short page-number lines are fingerprinted with digits masked, so "Page 3
+    of 40" and "Page 4 of 40" count as the same line; every other line must
+    repeat exactly, so table rows whose figures change from page to page are
+    kept. A fingerprint seen on more than threshold of the pages is
+    boilerplate and removed by clean().
+    """
+
+    def __init__(self, threshold=0.7, min_pages=8, max_line_chars=200, max_masked_chars=60):
+        self.threshold = threshold
+        self.min_pages = min_pages
+        self.max_line_chars = max_line_chars
+        self.max_masked_chars = max_masked_chars
+        self.page_counts = Counter()
+        self.pages_seen = 0
+        self.boilerplate = None
+        self.lines_removed = 0
+        self.chars_removed = 0
+
+    def fingerprint(self, line):
+        line = line.strip()
+        if not line or len(line) > self.max_line_chars:
+            return None  # long lines are body text even when quoted repeatedly
+        normalized = WHITESPACE.sub(' ', line.lower())
+        if len(normalized) <= self.max_masked_chars and PAGE_NUMBER.search(normalized):
+            normalized = DIGITS.sub('#', normalized)
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+    def observe(self, text):
+        """Count each distinct line fingerprint once per page"""
+        fingerprints = {self.fingerprint(line) for line in text.splitlines()}
+        fingerprints.discard(None)
+        self.page_counts.update(fingerprints)
+        self.pages_seen += 1
+        self.boilerplate = None
+
+    def boilerplate_fingerprints(self):
+        if self.boilerplate is None:
+            if self.pages_seen < self.min_pages:
+                self.boilerplate = set()
+            else:
+                cutoff = self.threshold * self.pages_seen
+                self.boilerplate = {fp for fp, count in self.page_counts.items() if count > cutoff}
+        return self.boilerplate
+
+    def clean(self, text):
+        """Return text with boilerplate lines removed"""
+        boilerplate = self.boilerplate_fingerprints()
+        if not boilerplate:
+            return text
+        kept = []
+        for line in text.splitlines():
+            if self.fingerprint(line) in boilerplate:
+                self.lines_removed += 1
+                self.chars_removed += len(line)
+            else:
+                kept.append(line)
+        return '\n'.join(kept)
+
+    def stats(self):
+        return {
+            'threshold': self.threshold,
+            'pages': self.pages_seen,
+            'fingerprints': len(self.boilerplate_fingerprints()),
+            'lines_removed': self.lines_removed,
+            'chars_removed': self.chars_removed,
+        }
@@ -0,0 +1,68 @@
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from django.db import connections
+
+
+def run_in_pool_thread(fn, *args):
+    """Call fn on a pool thread, then close the DB connections Django opened for that thread"""
+    try:
+        return fn(*args)
+    finally:
+        connections.close_all()
+
+
+def bounded_ordered_map(fn, items, max_in_flight):
+    """Yield (item, fn(item)) in input order with at most max_in_flight calls running.
+
+    Items are pulled lazily, so this composes with generator pipelines: a slow
+    result at the head of the queue holds back output but never lets more than
+    max_in_flight calls pile up behind it.
+    """
+    if max_in_flight <= 1:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    pending = deque()
+    try:
+        for item in items:
+            # Run in a copy of the caller's context so AI call settings reach the worker threads
+            pending.append((item, executor.submit(contextvars.copy_context().run, run_in_pool_thread, fn, item)))
+            if len(pending) >= max_in_flight:
+                head, future = pending.popleft()
+                yield head, future.result()
+        while pending:
+            head, future = pending.popleft()
+            yield head, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def gather_with_deadline(calls, timeout=None):
+    """Run named zero-argument callables concurrently and wait at most timeout seconds.
+
+    Returns (results, errors): results maps names to return values, errors maps
+    names to the exception they raised. Names in neither dict missed the
+    deadline; those calls keep running in the background and are abandoned.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, len(calls)))
+    futures = {
+        executor.submit(contextvars.copy_context().run, run_in_pool_thread, fn): name
+        for name, fn in calls.items()
+    }
+    results, errors = {}, {}
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+    except FuturesTimeout:
+        pass
+    finally:
+        # Don't wait for stragglers; their responses still land in the AI cache when they finish
+        executor.shutdown(wait=False)
+    return results, errors
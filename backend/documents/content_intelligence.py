@@ -1,5 +1,5 @@
 from .models import Document, ContentChunk
-from .ai_processor import AIStoryTransformer
+from .ai_provider import get_ai_transformer
 import re
 from collections import Counter
 
@@ -7,7 +7,7 @@ class ContentIntelligenceEngine:
     """Smart content analysis and processing engine"""
     
     def __init__(self):
-        self.ai_processor = AIStoryTransformer()
+        self.ai_processor = get_ai_transformer()
     
     def analyze_document_structure(self, document):
         """Analyze document structure and extract metadata"""
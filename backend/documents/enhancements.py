@@ -0,0 +1,115 @@
+import hashlib
+from django.conf import settings
+from django.db import IntegrityError
+from .ai_provider import get_ai_transformer
+from .ai_resilience import AIUnavailableError
+from .concurrency import bounded_ordered_map, gather_with_deadline
+from .models import ChunkEnhancement
+
+ENHANCEMENT_PARTS = ('enhanced_content', 'connections')
+
+
+def interests_key(interests):
+    """Stable key for an interest list; order matters because the prompts use it"""
+    return hashlib.sha256('\x1f'.join(interests or []).encode('utf-8')).hexdigest()
+
+
+def find_enhancement(chunk, interests, reading_level, prompt_version=None):
+    if prompt_version is None:
+        prompt_version = get_ai_transformer().ENHANCEMENT_PROMPT_VERSION
+    return ChunkEnhancement.objects.filter(
+        chunk=chunk,
+        interests_key=interests_key(interests),
+        reading_level=reading_level,
+        prompt_version=prompt_version,
+    ).first()
+
+
+def generate_enhancement(chunk, interests, reading_level, timeout=None):
+    """Run both enhancement prompts for a chunk concurrently, returns (unsaved ChunkEnhancement, missing parts).
+
+    Parts that fail, miss the timeout or come back as fallback text are listed in missing and left empty.
+    """
+    ai_transformer = get_ai_transformer()
+    results, errors = gather_with_deadline({
+        'enhanced_content': lambda: ai_transformer.add_contextual_enhancements(
+            chunk.content, interests, reading_level
+        ),
+        'connections': lambda: ai_transformer.highlight_connections(chunk.content, interests),
+    }, timeout)
+
+    # Only an outage affecting every part is an error; anything else degrades to a partial result
+    if errors and not results and all(isinstance(e, AIUnavailableError) for e in errors.values()):
+        raise next(iter(errors.values()))
+    # The transformer answers a failed call with fallback text rather than raising
+    fallback = ai_transformer.create_fallback()
+    results = {part: text for part, text in results.items() if text != fallback}
+
+    enhancement = ChunkEnhancement(
+        chunk=chunk,
+        interests_key=interests_key(interests),
+        reading_level=reading_level,
+        prompt_version=ai_transformer.ENHANCEMENT_PROMPT_VERSION,
+        enhanced_content=results.get('enhanced_content', ''),
+        connections=results.get('connections', ''),
+    )
+    missing = [part for part in ENHANCEMENT_PARTS if part not in results]
+    return enhancement, missing
+
+
+def store_enhancement(enhancement):
+    """Save a generated enhancement unless it holds fallback text, returns the stored row if any"""
+    # Fallback text means a model call failed, so it is served once but generated again next time
+    fallback = get_ai_transformer().create_fallback()
+    if fallback in (enhancement.enhanced_content, enhancement.connections):
+        return None
+
+    try:
+        enhancement.save()
+    except IntegrityError:
+        # Another request generated the same enhancement first
+        return ChunkEnhancement.objects.filter(
+            chunk_id=enhancement.chunk_id,
+            interests_key=enhancement.interests_key,
+            reading_level=enhancement.reading_level,
+            prompt_version=enhancement.prompt_version,
+        ).first()
+    return enhancement
+
+
+def get_or_create_enhancement(chunk, interests, reading_level, timeout=None):
+    """Return (enhancement, missing parts), generating and storing it on first use.
+
+    A partial enhancement (some parts missed the timeout or failed) is returned but not stored.
+    """
+    enhancement = find_enhancement(chunk, interests, reading_level)
+    if enhancement is not None:
+        return enhancement, []
+
+    enhancement, missing = generate_enhancement(chunk, interests, reading_level, timeout)
+    if missing:
+        return enhancement, missing
+    return store_enhancement(enhancement) or enhancement, []
+
+
+def pregenerate_enhancements(document, interests, reading_level):
+    """Generate missing enhancements for every chunk of a document, returns how many were stored"""
+    done = ChunkEnhancement.objects.filter(
+        chunk__document=document,
+        interests_key=interests_key(interests),
+        reading_level=reading_level,
+        prompt_version=get_ai_transformer().ENHANCEMENT_PROMPT_VERSION,
+    ).values_list('chunk_id', flat=True)
+    chunks = document.chunks.exclude(id__in=list(done)).order_by('chunk_index')
+
+    # Model calls run concurrently; rows are written here so only this thread touches the DB
+    results = bounded_ordered_map(
+        lambda chunk: generate_enhancement(chunk, interests, reading_level),
+        chunks.iterator(),
+        getattr(settings, 'AI_MAX_CONCURRENCY', 4),
+    )
+    stored = 0
+    for chunk, (enhancement, missing) in results:
+        if not missing:
+            stored += store_enhancement(enhancement) is not None
+    return stored
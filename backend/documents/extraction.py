@@ -0,0 +1,214 @@
+import gc
+import io
+import math
+import os
+import resource
+import pdfplumber
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Not on Linux, fall back to the lifetime peak reported by the kernel
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ExtractionBackend:
+    """Interface for PDF text extractors; each call opens the file independently"""
+    name = None
+
+    def iter_range(self, path, start, stop):
+        """Yield the text of pages [start, stop) in order"""
+        raise NotImplementedError
+
+    def extract_range(self, path, start, stop):
+        return list(self.iter_range(path, start, stop))
+
+
+class PdfplumberBackend(ExtractionBackend):
+    """Most accurate layout-aware extraction, and the slowest"""
+    name = 'pdfplumber'
+
+    def iter_range(self, path, start, stop):
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages[start:stop]:
+                text = page.extract_text() or ""
+                page.close()  # drop the page's layout caches as soon as we have its text
+                yield text
+
+
+class PdfminerBackend(ExtractionBackend):
+    """Raw pdfminer.six with box ordering and vertical detection turned off"""
+    name = 'pdfminer'
+
+    def iter_range(self, path, start, stop):
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        laparams = LAParams(boxes_flow=None, detect_vertical=False, all_texts=False)
+        resource_manager = PDFResourceManager(caching=True)
+        with open(path, 'rb') as fp:
+            for page in PDFPage.get_pages(fp, pagenos=set(range(start, stop))):
+                output = io.StringIO()
+                device = TextConverter(resource_manager, output, laparams=laparams)
+                PDFPageInterpreter(resource_manager, device).process_page(page)
+                device.close()
+                yield output.getvalue().strip()
+
+
+class PypdfBackend(ExtractionBackend):
+    """pypdf (or PyPDF2) content-stream extraction, fast but without layout analysis"""
+    name = 'pypdf'
+
+    def iter_range(self, path, start, stop):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            from PyPDF2 import PdfReader
+
+        reader = PdfReader(path)
+        for index in range(start, min(stop, len(reader.pages))):
+            yield reader.pages[index].extract_text() or ""
+
+
+EXTRACTION_BACKENDS = {
+    backend.name: backend for backend in (PdfplumberBackend, PdfminerBackend, PypdfBackend)
+}
+
+
+def get_extraction_backend(name=None, page_count=None):
+    """Pick the configured backend, switching to the large-document backend above the threshold"""
+    if name is None:
+        name = getattr(settings, 'PDF_EXTRACTION_BACKEND', 'pdfplumber')
+        large_backend = getattr(settings, 'PDF_EXTRACTION_LARGE_BACKEND', '')
+        threshold = getattr(settings, 'PDF_EXTRACTION_LARGE_PAGE_THRESHOLD', 0)
+        if large_backend and threshold and page_count is not None and page_count >= threshold:
+            name = large_backend
+
+    if name not in EXTRACTION_BACKENDS:
+        raise ValueError(f"Unknown PDF extraction backend '{name}'")
+    return EXTRACTION_BACKENDS[name]()
+
+
+def count_pages(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(backend_name, path, start, stop):
+    """Extract text for pages [start, stop) in a worker with its own file handle.
+
+    Returns (texts, peak_rss_mb) so the parent can report worker memory.
+    """
+    texts = []
+    peak_rss = current_rss_mb()
+    for text in get_extraction_backend(backend_name).iter_range(path, start, stop):
+        texts.append(text)
+        peak_rss = max(peak_rss, current_rss_mb())
+    return texts, peak_rss
+
+
+class PageExtractor:
+    """Extract page text from a PDF, optionally fanning out across processes"""
+
+    def __init__(self, path, workers=None, batch_pages=None, low_memory=None,
+                 window_pages=None, memory_ceiling_mb=None, backend=None):
+        self.path = path
+        self.workers = workers if workers is not None else getattr(settings, 'PDF_EXTRACTION_WORKERS', 1)
+        self.batch_pages = batch_pages or getattr(settings, 'PDF_EXTRACTION_BATCH_PAGES', 0)
+        self.window_pages = window_pages or getattr(settings, 'PDF_EXTRACTION_WINDOW_PAGES', 50)
+        self.memory_ceiling_mb = (
+            memory_ceiling_mb if memory_ceiling_mb is not None
+            else getattr(settings, 'PDF_EXTRACTION_MEMORY_CEILING_MB', 0)
+        )
+        self.page_count = count_pages(path)
+        self.backend = get_extraction_backend(backend, self.page_count)
+        self.low_memory = low_memory if low_memory is not None else self.should_use_low_memory()
+        self.peak_rss_mb = current_rss_mb()
+        self.window_shrinks = 0
+
+    def should_use_low_memory(self):
+        if getattr(settings, 'PDF_EXTRACTION_LOW_MEMORY', False):
+            return True
+        threshold = getattr(settings, 'PDF_LOW_MEMORY_PAGE_THRESHOLD', 500)
+        return bool(threshold) and self.page_count >= threshold
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'workers': self.workers,
+            'low_memory': self.low_memory,
+            'window_pages': self.window_pages,
+            'window_shrinks': self.window_shrinks,
+            'peak_rss_mb': round(self.peak_rss_mb, 1),
+        }
+
+    def sample_rss(self):
+        rss = current_rss_mb()
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        return rss
+
+    def iter_pages(self):
+        """Yield (page_number, text) tuples in page order"""
+        if self.workers > 1 and self.page_count >= 2:
+            yield from self.iter_pages_parallel()
+        elif self.low_memory:
+            yield from self.iter_pages_windowed()
+        else:
+            yield from self.iter_pages_sequential()
+
+    def iter_pages_sequential(self):
+        for page_num, text in enumerate(self.backend.iter_range(self.path, 0, self.page_count), 1):
+            self.sample_rss()
+            yield page_num, text
+
+    def iter_pages_windowed(self):
+        """Reopen the PDF every window so the parser's object caches are released too.
+
+        When RSS goes over the configured ceiling the window is halved, trading
+        some re-open overhead for a bounded footprint.
+        """
+        next_page = 0
+        while next_page < self.page_count:
+            stop = min(next_page + self.window_pages, self.page_count)
+            window = self.backend.iter_range(self.path, next_page, stop)
+            for text in window:
+                next_page += 1
+                yield next_page, text
+
+                rss = self.sample_rss()
+                if self.memory_ceiling_mb and rss > self.memory_ceiling_mb:
+                    gc.collect()
+                    if self.window_pages > 1:
+                        self.window_pages = max(1, self.window_pages // 2)
+                        self.window_shrinks += 1
+                        break
+            window.close()
+            gc.collect()
+
+    def iter_pages_parallel(self):
+        workers = min(self.workers, self.page_count)
+        # Several batches per worker keeps the pool busy when page cost is uneven
+        batch_pages = self.batch_pages or max(1, math.ceil(self.page_count / (workers * 4)))
+        if self.low_memory:
+            batch_pages = min(batch_pages, self.window_pages)
+        starts = list(range(0, self.page_count, batch_pages))
+        stops = [min(start + batch_pages, self.page_count) for start in starts]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() returns results in submission order, so pages stay ordered
+            results = executor.map(
+                extract_page_range, [self.backend.name] * len(starts), [self.path] * len(starts), starts, stops
+            )
+            for start, (texts, worker_peak_rss) in zip(starts, results):
+                self.peak_rss_mb = max(self.peak_rss_mb, worker_peak_rss)
+                for offset, text in enumerate(texts):
+                    yield start + offset + 1, text
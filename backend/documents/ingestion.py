@@ -0,0 +1,272 @@
+import os
+import signal
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .ai_context import ai_call_context
+from .ai_metrics import get_call_recorder
+from .ai_resilience import AIUnavailableError
+from .ai_scheduler import BULK
+from .artifacts import generate_chunk_artifacts
+from .enhancements import pregenerate_enhancements
+from .models import Document, IngestionJob
+from .pdf_processor import PDFProcessor
+from .summarization import DocumentSummarizer
+
+
+class JobTimeout(BaseException):
+    """Raised inside a worker when a job runs past its time budget.
+
+    A BaseException, so the broad `except Exception` handlers of the AI path
+    (fallback text, retries) can't swallow it and let the job carry on.
+    """
+
+
+def enqueue_document(document, job_type=IngestionJob.PROCESS, payload=None):
+    """Queue a document for background ingestion and return the job"""
+    return IngestionJob.objects.create(
+        document=document,
+        job_type=job_type,
+        payload=payload or {},
+        max_attempts=getattr(settings, 'INGESTION_MAX_ATTEMPTS', 3),
+        timeout_seconds=getattr(settings, 'INGESTION_JOB_TIMEOUT', 600),
+    )
+
+
+def enqueue_story_prefetch(document, start):
+    """Queue story generation for the chunks just ahead of the reader, returns the job or None"""
+    window = getattr(settings, 'STORY_PREFETCH_WINDOW', 5)
+    end = start + window
+    running = IngestionJob.objects.filter(
+        document=document, job_type=IngestionJob.PREFETCH_STORY, status=IngestionJob.RUNNING
+    ).first()
+    if running is not None:
+        running_start = running.payload.get('start', 0)
+        running_end = running_start + running.payload.get('count', window)
+        if running_start <= start < running_end:
+            # The running job is already generating the head of this window, so only the rest needs a job
+            if end <= running_end:
+                return running
+            start = running_end
+
+    pending = document.chunks.filter(
+        chunk_index__gte=start, chunk_index__lt=end, metadata__story_status='pending'
+    )
+    if not pending.exists():
+        return None
+
+    payload = {'start': start, 'count': end - start}
+    # A reader who keeps scrolling only needs the newest window, so move a waiting job forward
+    queued = IngestionJob.objects.filter(
+        document=document, job_type=IngestionJob.PREFETCH_STORY, status=IngestionJob.QUEUED
+    ).first()
+    if queued is not None:
+        queued.payload = payload
+        queued.save(update_fields=['payload'])
+        return queued
+
+    job = enqueue_document(document, IngestionJob.PREFETCH_STORY, payload)
+    job.priority = 10
+    job.save(update_fields=['priority'])
+    return job
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+class IngestionWorker:
+    """Polls the DB-backed queue and runs ingestion jobs one at a time"""
+
+    def __init__(self, name=None, poll_interval=None):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval or getattr(settings, 'INGESTION_POLL_INTERVAL', 2)
+        self.retry_backoff = getattr(settings, 'INGESTION_RETRY_BACKOFF', 30)
+        self.stopping = False
+        self.handlers = {
+            IngestionJob.PROCESS: self.handle_process,
+            IngestionJob.REPROCESS: self.handle_process,
+            IngestionJob.PREFETCH_STORY: self.handle_prefetch_story,
+            IngestionJob.ENHANCE: self.handle_enhance,
+            IngestionJob.SUMMARIZE: self.handle_summarize,
+            IngestionJob.ARTIFACTS: self.handle_artifacts,
+        }
+
+    def run_forever(self):
+        """Main worker loop, exits after the current job on SIGTERM/SIGINT"""
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"👷 Ingestion worker {self.name} started")
+
+        while not self.stopping:
+            close_old_connections()
+            if not self.run_next():
+                time.sleep(self.poll_interval)
+
+        print(f"👋 Ingestion worker {self.name} stopped")
+
+    def run_until_empty(self):
+        """Drain the queue in the current process, returns number of jobs run"""
+        processed = 0
+        while self.run_next():
+            processed += 1
+        return processed
+
+    def request_stop(self, signum=None, frame=None):
+        self.stopping = True
+
+    def run_next(self):
+        """Claim and run a single job, returns False when nothing was ready"""
+        self.requeue_stale_jobs()
+        job = self.claim_next_job()
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def claim_next_job(self):
+        """Atomically move the highest-priority, oldest ready job from queued to running.
+
+        Within a priority, jobs of users with fewer running jobs go first, so one
+        large upload can't occupy every worker while other users wait.
+        """
+        now = timezone.now()
+        candidates = list(IngestionJob.objects.filter(
+            status=IngestionJob.QUEUED, run_after__lte=now
+        ).order_by('-priority', 'run_after', 'id').values_list('id', 'priority', 'document__user_id')[:50])
+        running = Counter(IngestionJob.objects.filter(status=IngestionJob.RUNNING).values_list(
+            'document__user_id', flat=True
+        ))
+        # Stable sort, so jobs of equally busy users keep their queue order
+        candidates.sort(key=lambda candidate: (-candidate[1], running[candidate[2]]))
+
+        for job_id, _, _ in candidates:
+            # Conditional update acts as the lock, so two workers never claim the same job
+            claimed = IngestionJob.objects.filter(id=job_id, status=IngestionJob.QUEUED).update(
+                status=IngestionJob.RUNNING,
+                locked_by=self.name,
+                locked_at=now,
+                started_at=now,
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return IngestionJob.objects.select_related('document').get(id=job_id)
+        return None
+
+    def requeue_stale_jobs(self):
+        """Put back jobs whose worker died without finishing them"""
+        now = timezone.now()
+        for job in IngestionJob.objects.filter(status=IngestionJob.RUNNING):
+            deadline = job.locked_at + timedelta(seconds=job.timeout_seconds + self.retry_backoff)
+            if deadline < now:
+                IngestionJob.objects.filter(id=job.id, status=IngestionJob.RUNNING, locked_at=job.locked_at).update(
+                    status=IngestionJob.QUEUED if job.attempts < job.max_attempts else IngestionJob.FAILED,
+                    locked_by='',
+                    last_error=f'Worker {job.locked_by} stopped responding',
+                )
+
+    def run_job(self, job):
+        """Run a claimed job under its timeout and record the outcome"""
+        handler = self.handlers[job.job_type]
+        use_alarm = hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread()
+
+        if use_alarm:
+            previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+            signal.alarm(job.timeout_seconds)
+        try:
+            # Ingestion is bulk work: it waits out the shared AI rate limit instead of failing,
+            # yields to interactive calls and shares capacity fairly between document owners
+            with ai_call_context(max_wait=getattr(settings, 'AI_INGESTION_MAX_WAIT', 300),
+                                 document_id=job.document_id, priority=BULK, user_id=job.document.user_id):
+                handler(job)
+        except AIUnavailableError as e:
+            self.defer(job, e)
+        except JobTimeout:
+            self.mark_failed(job, f'Timed out after {job.timeout_seconds}s')
+        except Exception as e:
+            self.mark_failed(job, str(e))
+        else:
+            job.status = IngestionJob.SUCCEEDED
+            job.finished_at = timezone.now()
+            job.last_error = ''
+            job.save(update_fields=['status', 'finished_at', 'last_error'])
+        finally:
+            if use_alarm:
+                signal.alarm(0)
+                signal.signal(signal.SIGALRM, previous_handler)
+            get_call_recorder().flush()
+
+    def defer(self, job, error):
+        """Put a job back without spending an attempt while the AI service is unavailable"""
+        delay = max(error.retry_after or 0, self.poll_interval)
+        job.status = IngestionJob.QUEUED
+        job.attempts -= 1
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        job.last_error = str(error)
+        job.locked_by = ''
+        job.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'locked_by'])
+
+        if job.job_type in (IngestionJob.PROCESS, IngestionJob.REPROCESS):
+            job.document.status = Document.UPLOADED
+            job.document.save(update_fields=['status'])
+        print(f"⏸️ Job {job.id} deferred {delay:.0f}s: {error}")
+
+    def mark_failed(self, job, error):
+        """Schedule a retry with exponential backoff, or give up for good"""
+        job.last_error = error
+        job.locked_by = ''
+        document = job.document
+
+        if job.attempts < job.max_attempts:
+            job.status = IngestionJob.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=self.retry_backoff * 2 ** (job.attempts - 1))
+            document.status = Document.UPLOADED
+            print(f"🔁 Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}), retrying: {error}")
+        else:
+            job.status = IngestionJob.FAILED
+            job.finished_at = timezone.now()
+            document.status = Document.FAILED
+            print(f"❌ Job {job.id} failed permanently: {error}")
+
+        job.save(update_fields=['status', 'run_after', 'last_error', 'locked_by', 'finished_at'])
+        # A failed prefetch leaves the document readable; the chunks simply stay pending
+        if job.job_type in (IngestionJob.PROCESS, IngestionJob.REPROCESS):
+            document.save(update_fields=['status'])
+
+    def handle_process(self, job):
+        # PDFProcessor resumes from the document's checkpoint, so retries skip finished pages
+        processor = PDFProcessor(job.document_id)
+        processor.process_document()
+        if processor.lazy_stories and processor.document.reading_mode == 'story':
+            enqueue_story_prefetch(processor.document, 0)
+        # Lazy documents have no generated stories yet, and their pending chunks are skipped anyway
+        if getattr(settings, 'CHUNK_ARTIFACTS_AT_INGESTION', False) and not processor.lazy_stories:
+            enqueue_document(processor.document, IngestionJob.ARTIFACTS, {
+                'reading_level': processor.get_reading_level(),
+            })
+
+    def handle_prefetch_story(self, job):
+        processor = PDFProcessor(job.document_id)
+        generated = processor.generate_pending_stories(job.payload.get('start', 0), job.payload.get('count', 5))
+        print(f"📖 Prefetched {generated} stories for document {job.document_id}")
+
+    def handle_enhance(self, job):
+        # Chunks that already have an enhancement are skipped, so a retried job picks up where it stopped
+        stored = pregenerate_enhancements(job.document, job.payload['interests'], job.payload['reading_level'])
+        print(f"✨ Stored {stored} enhancements for document {job.document_id}")
+
+    def handle_artifacts(self, job):
+        # Chunks with current artifacts are skipped, so retries and re-runs only fill the gaps
+        stored = generate_chunk_artifacts(job.document, job.payload.get('reading_level', 'casual'))
+        print(f"🗂️ Stored artifacts for {stored} chunks of document {job.document_id}")
+
+    def handle_summarize(self, job):
+        summary = DocumentSummarizer(job.document).summarize()
+        print(f"📝 Summarized document {job.document_id} "
+              f"({summary['generated']['chunks']} chunk summaries, {summary['generated']['nodes']} merges generated)")
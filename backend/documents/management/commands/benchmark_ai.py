@@ -0,0 +1,95 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from documents.ai_cache import get_response_cache
+from documents.ai_provider import get_ai_transformer
+from documents.ai_resilience import AIUnavailableError
+from documents.concurrency import bounded_ordered_map
+from documents.enhancements import generate_enhancement
+from documents.extraction import PageExtractor
+from documents.models import ContentChunk
+from documents.pdf_processor import PDFProcessor
+
+SCENARIOS = ('ingest', 'enhance', 'recommendations')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0
+
+
+class Command(BaseCommand):
+    help = 'Measure AI pipeline throughput and latency against the configured model backend (AI_BACKEND)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pdf', help='PDF whose sections drive the ingest and enhance scenarios')
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8],
+                            help='In-flight call limits to compare')
+        parser.add_argument('--requests', type=int, default=20, help='Recommendation requests per run')
+        parser.add_argument('--use-cache', action='store_true',
+                            help='Keep the response cache and story store on (off by default)')
+
+    def handle(self, *args, **options):
+        ai_transformer = get_ai_transformer()
+        if ai_transformer.backend.name != 'fake':
+            self.stdout.write(self.style.WARNING(
+                f'Benchmarking the live {ai_transformer.backend.name} backend; set AI_BACKEND=fake to run offline'
+            ))
+        # Identical prompts across runs would otherwise be served from the cache after the first one
+        get_response_cache().enabled = options['use_cache']
+        use_store = options['use_cache']  # same for stories kept in the shared story store
+
+        text = '\n\n'.join(text for page_num, text in PageExtractor(options['pdf']).iter_pages())
+        sections = [section for section in PDFProcessor.split_into_sections(text) if len(section) > 50]
+        if not sections:
+            raise CommandError(f"No story sections found in {options['pdf']}")
+
+        tasks = {
+            'ingest': (sections, lambda section: ai_transformer.transform_to_story(
+                section, ['science'], 'casual', use_store=use_store
+            )),
+            'enhance': (sections, lambda section: generate_enhancement(
+                ContentChunk(content=section), ['science'], 'casual'
+            )),
+            'recommendations': (range(options['requests']), lambda i: ai_transformer.generate_recommendations(
+                [f'interest {i}'], []
+            )),
+        }
+
+        self.stdout.write(f"{'scenario':<16} {'limit':>5} {'items':>6} {'items/s':>8} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for scenario in options['scenarios']:
+            items, fn = tasks[scenario]
+            for limit in options['concurrency']:
+                self.report(scenario, limit, *self.run(items, fn, limit))
+
+        # Where the router sent the calls, and how fast each tier was
+        for tier, tier_stats in ai_transformer.router.stats().items():
+            self.stdout.write(f"tier {tier:<10} {tier_stats['model_name']:<24} "
+                              f"p95 {tier_stats['p95_latency_ms']:>8.0f} ms  {tier_stats['decisions']}")
+
+    def run(self, items, fn, limit):
+        latencies = []
+        errors = 0
+
+        def timed(item):
+            started = time.perf_counter()
+            try:
+                fn(item)
+                return time.perf_counter() - started, None
+            except AIUnavailableError as e:
+                return time.perf_counter() - started, e
+
+        started = time.perf_counter()
+        for item, (latency, error) in bounded_ordered_map(timed, items, limit):
+            latencies.append(latency)
+            errors += error is not None
+        return latencies, errors, time.perf_counter() - started
+
+    def report(self, scenario, limit, latencies, errors, wall_seconds):
+        self.stdout.write(
+            f"{scenario:<16} {limit:>5} {len(latencies):>6} {len(latencies) / wall_seconds:>8.2f} "
+            f"{statistics.median(latencies) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+            f"{percentile(latencies, 0.99) * 1000:>8.0f} {errors:>7}"
+        )
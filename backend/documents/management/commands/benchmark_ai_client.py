@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from documents.ai_processor import AIStoryTransformer
+from documents.ai_provider import get_ai_transformer, provider_stats, reset_ai_transformer
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request AI client construction against the shared provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            AIStoryTransformer()
+        per_request = (time.perf_counter() - started) / iterations
+
+        reset_ai_transformer()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            get_ai_transformer()
+        shared = (time.perf_counter() - started) / iterations
+
+        self.stdout.write(f'Fresh AIStoryTransformer per request: {per_request * 1000:.2f} ms')
+        self.stdout.write(f'Shared provider lookup:              {shared * 1000:.4f} ms (incl. one-time init)')
+        self.stdout.write(f'Provider stats: {provider_stats()}')
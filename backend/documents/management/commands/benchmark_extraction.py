@@ -0,0 +1,106 @@
+import difflib
+import multiprocessing
+import queue
+import resource
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from documents.extraction import EXTRACTION_BACKENDS, count_pages, get_extraction_backend
+
+BASELINE_BACKEND = 'pdfplumber'
+
+
+def _run_backend(backend_name, path, page_count, results):
+    """Runs in a fresh process so ru_maxrss is the peak of this backend alone"""
+    started = time.perf_counter()
+    texts = get_extraction_backend(backend_name).extract_range(path, 0, page_count)
+    elapsed = time.perf_counter() - started
+    results.put({
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'text': '\n'.join(texts),
+    })
+
+
+def text_similarity(baseline, candidate):
+    """Word-sequence similarity in [0, 1], insensitive to whitespace differences"""
+    return difflib.SequenceMatcher(None, baseline.split(), candidate.split(), autojunk=False).ratio()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every PDF extraction backend over a local corpus of PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus', help='Directory containing PDF files (searched recursively)')
+        parser.add_argument(
+            '--backends', nargs='+', default=list(EXTRACTION_BACKENDS),
+            help=f'Backends to compare (default: all of {", ".join(EXTRACTION_BACKENDS)})'
+        )
+        parser.add_argument('--limit', type=int, default=0, help='Only benchmark the first N files')
+        parser.add_argument('--timeout', type=int, default=600, help='Seconds allowed per backend per file')
+
+    def handle(self, *args, **options):
+        corpus = Path(options['corpus'])
+        files = sorted(corpus.rglob('*.pdf'))
+        if options['limit']:
+            files = files[:options['limit']]
+        if not files:
+            raise CommandError(f'No PDF files found under {corpus}')
+
+        backends = options['backends']
+        unknown = set(backends) - set(EXTRACTION_BACKENDS)
+        if unknown:
+            raise CommandError(f'Unknown backend(s): {", ".join(sorted(unknown))}')
+        if BASELINE_BACKEND not in backends:
+            backends = [BASELINE_BACKEND] + backends
+
+        context = multiprocessing.get_context('fork')
+        totals = {name: {'pages': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0, 'similarity': [], 'errors': 0}
+                  for name in backends}
+
+        for path in files:
+            page_count = count_pages(str(path))
+            baseline_text = None
+            self.stdout.write(f'{path.name} ({page_count} pages)')
+
+            for name in backends:
+                results = context.Queue()
+                process = context.Process(target=_run_backend, args=(name, str(path), page_count, results))
+                process.start()
+                try:
+                    result = results.get(timeout=options['timeout'])
+                except queue.Empty:
+                    result = None
+                    process.terminate()
+                process.join()
+
+                if result is None or process.exitcode != 0:
+                    totals[name]['errors'] += 1
+                    self.stdout.write(self.style.WARNING(f'  {name:<12} failed'))
+                    continue
+
+                if name == BASELINE_BACKEND:
+                    baseline_text = result['text']
+                similarity = text_similarity(baseline_text, result['text']) if baseline_text is not None else None
+
+                totals[name]['pages'] += page_count
+                totals[name]['seconds'] += result['seconds']
+                totals[name]['peak_rss_mb'] = max(totals[name]['peak_rss_mb'], result['peak_rss_mb'])
+                if similarity is not None:
+                    totals[name]['similarity'].append(similarity)
+
+                line = (f"  {name:<12} {page_count / result['seconds']:>9.1f} pages/s "
+                        f"{result['peak_rss_mb']:>8.1f} MB peak")
+                if similarity is not None:
+                    line += f"  similarity {similarity:.3f}"
+                self.stdout.write(line)
+
+        self.stdout.write('')
+        self.stdout.write(f"{'backend':<12} {'pages/s':>9} {'peak MB':>9} {'similarity':>11} {'errors':>7}")
+        for name, total in totals.items():
+            pages_per_second = total['pages'] / total['seconds'] if total['seconds'] else 0
+            similarity = sum(total['similarity']) / len(total['similarity']) if total['similarity'] else 0
+            self.stdout.write(
+                f"{name:<12} {pages_per_second:>9.1f} {total['peak_rss_mb']:>9.1f} "
+                f"{similarity:>11.3f} {total['errors']:>7}"
+            )
@@ -0,0 +1,51 @@
+import multiprocessing
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from documents.ingestion import IngestionWorker
+
+
+def _worker_main():
+    IngestionWorker().run_forever()
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of ingestion worker processes against the DB-backed job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'INGESTION_WORKERS', 2),
+            help='Number of worker processes to start'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue in this process and exit instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = IngestionWorker().run_until_empty()
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} ingestion job(s)'))
+            return
+
+        # Forked children must not share the parent's DB connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_worker_main)
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(workers)} ingestion worker(s)'))
+
+        def shutdown(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunks_ready',
+            field=models.IntegerField(default=0),
+        ),
+    ]
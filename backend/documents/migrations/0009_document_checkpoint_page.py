@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_documentpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='checkpoint_page',
+            field=models.IntegerField(default=0),
+        ),
+    ]
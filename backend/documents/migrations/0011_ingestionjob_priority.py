@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_airesponsecacheentry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingestionjob',
+            name='documents_i_status_d84e8a_idx',
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='priority',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='job_type',
+            field=models.CharField(choices=[('process', 'Process'), ('reprocess', 'Reprocess'), ('prefetch_story', 'Prefetch story')], default='process', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='ingestionjob',
+            index=models.Index(fields=['status', 'priority', 'run_after'], name='documents_i_status_7d61a4_idx'),
+        ),
+    ]
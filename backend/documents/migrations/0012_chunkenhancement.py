@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_ingestionjob_priority'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='job_type',
+            field=models.CharField(choices=[('process', 'Process'), ('reprocess', 'Reprocess'), ('prefetch_story', 'Prefetch story'), ('enhance', 'Enhance')], default='process', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ChunkEnhancement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interests_key', models.CharField(max_length=64)),
+                ('reading_level', models.CharField(max_length=20)),
+                ('prompt_version', models.IntegerField()),
+                ('enhanced_content', models.TextField()),
+                ('connections', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enhancements', to='documents.contentchunk')),
+            ],
+            options={
+                'unique_together': {('chunk', 'interests_key', 'reading_level', 'prompt_version')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_chunkenhancement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryTransformation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section_hash', models.CharField(max_length=64)),
+                ('primary_interest', models.CharField(max_length=100)),
+                ('reading_level', models.CharField(max_length=20)),
+                ('prompt_version', models.IntegerField()),
+                ('story', models.TextField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('section_hash', 'primary_interest', 'reading_level', 'prompt_version')},
+            },
+        ),
+    ]
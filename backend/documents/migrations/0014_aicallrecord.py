@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_storytransformation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICallRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prompt_type', models.CharField(choices=[('story', 'Story'), ('story_batch', 'Story batch'), ('enhancement', 'Enhancement'), ('connection', 'Connection'), ('summary', 'Summary'), ('key_points', 'Key points'), ('questions', 'Questions'), ('recommendations', 'Recommendations'), ('reading_level', 'Reading level'), ('other', 'Other')], default='other', max_length=20)),
+                ('model_name', models.CharField(max_length=100)),
+                ('outcome', models.CharField(choices=[('success', 'Success'), ('cache_hit', 'Cache hit'), ('fallback', 'Fallback'), ('unavailable', 'Unavailable'), ('error', 'Error')], max_length=20)),
+                ('cache_hit', models.BooleanField(default=False)),
+                ('latency_ms', models.FloatField(default=0)),
+                ('input_tokens', models.IntegerField(default=0)),
+                ('output_tokens', models.IntegerField(default=0)),
+                ('cost_usd', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_calls', to='documents.document')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['prompt_type', 'created_at'], name='documents_a_prompt__622bd4_idx')],
+            },
+        ),
+    ]
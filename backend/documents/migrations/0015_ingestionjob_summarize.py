@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_aicallrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='job_type',
+            field=models.CharField(choices=[('process', 'Process'), ('reprocess', 'Reprocess'), ('prefetch_story', 'Prefetch story'), ('enhance', 'Enhance'), ('summarize', 'Summarize')], default='process', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_ingestionjob_summarize'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contentchunk',
+            name='artifacts',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='aicallrecord',
+            name='prompt_type',
+            field=models.CharField(choices=[('story', 'Story'), ('story_batch', 'Story batch'), ('enhancement', 'Enhancement'), ('connection', 'Connection'), ('summary', 'Summary'), ('key_points', 'Key points'), ('questions', 'Questions'), ('recommendations', 'Recommendations'), ('reading_level', 'Reading level'), ('artifacts', 'Artifacts'), ('other', 'Other')], default='other', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='ingestionjob',
+            name='job_type',
+            field=models.CharField(choices=[('process', 'Process'), ('reprocess', 'Reprocess'), ('prefetch_story', 'Prefetch story'), ('enhance', 'Enhance'), ('summarize', 'Summarize'), ('artifacts', 'Artifacts')], default='process', max_length=20),
+        ),
+    ]
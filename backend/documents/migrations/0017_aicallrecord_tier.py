@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_contentchunk_artifacts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aicallrecord',
+            name='route_reason',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='aicallrecord',
+            name='tier',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from django.conf import settings
+from .ai_metrics import percentile
+
+TASK = 'task'
+SMALL_INPUT = 'small_input'
+SLO_FALLBACK = 'slo_fallback'
+
+# reason is one of the constants above, telling why the request went to this tier
+Route = namedtuple('Route', ['tier', 'backend', 'reason'])
+
+
+class ModelRouter:
+    """Picks a model tier for each request.
+
+    A prompt type starts on its configured tier. Prompts of at most
+    small_input_tokens go to the fastest tier, and while a tier's p95 latency
+    over the last window_seconds is above the prompt type's SLO the request
+    steps down to the next faster tier. Old samples expire, so a slow tier
+    is tried again once the window has passed.
+    """
+
+    def __init__(self, tiers, routes=None, default_tier=None, small_input_tokens=0,
+                 latency_slo_ms=None, default_slo_ms=0, window_seconds=300, min_samples=20):
+        self.tiers = tiers  # tier name -> backend, fastest first
+        self.order = list(tiers)
+        self.routes = routes or {}
+        self.default_tier = default_tier if default_tier in tiers else self.order[-1]
+        self.small_input_tokens = small_input_tokens
+        self.latency_slo_ms = latency_slo_ms or {}
+        self.default_slo_ms = default_slo_ms
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self._latencies = {tier: deque() for tier in tiers}  # (monotonic time, latency ms)
+        self._decisions = {tier: Counter() for tier in tiers}
+        self._lock = threading.Lock()
+
+    def route(self, prompt_type, input_tokens):
+        tier = self.routes.get(prompt_type, self.default_tier)
+        if tier not in self.tiers:
+            tier = self.default_tier
+        reason = TASK
+        if input_tokens <= self.small_input_tokens and tier != self.order[0]:
+            tier, reason = self.order[0], SMALL_INPUT
+
+        slo_ms = self.latency_slo_ms.get(prompt_type, self.default_slo_ms)
+        index = self.order.index(tier)
+        # The fastest tier is used even when it is over budget too
+        while slo_ms and index > 0 and self.p95_ms(self.order[index]) > slo_ms:
+            index -= 1
+            reason = SLO_FALLBACK
+        tier = self.order[index]
+
+        with self._lock:
+            self._decisions[tier][reason] += 1
+        return Route(tier, self.tiers[tier], reason)
+
+    def observe(self, tier, latency_seconds):
+        """Record the latency of a completed model call on a tier"""
+        now = time.monotonic()
+        with self._lock:
+            samples = self._latencies[tier]
+            samples.append((now, latency_seconds * 1000))
+            self._expire(samples, now)
+
+    def p95_ms(self, tier):
+        """Recent p95 latency of a tier, 0 until it has min_samples calls in the window"""
+        with self._lock:
+            samples = self._latencies[tier]
+            self._expire(samples, time.monotonic())
+            if len(samples) < self.min_samples:
+                return 0
+            return percentile([latency for _, latency in samples], 0.95)
+
+    def _expire(self, samples, now):
+        while samples and samples[0][0] < now - self.window_seconds:
+            samples.popleft()
+
+    def stats(self):
+        p95 = {tier: self.p95_ms(tier) for tier in self.order}
+        with self._lock:
+            return {
+                tier: {
+                    'model_name': self.tiers[tier].model_name,
+                    'samples': len(self._latencies[tier]),
+                    'p95_latency_ms': round(p95[tier], 1),
+                    'decisions': dict(self._decisions[tier]),
+                }
+                for tier in self.order
+            }
+
+
+def create_model_router(tiers):
+    """ModelRouter over tiers (name -> backend, fastest first) configured from settings"""
+    return ModelRouter(
+        tiers,
+        routes=getattr(settings, 'AI_TIER_ROUTES', {}),
+        default_tier=getattr(settings, 'AI_DEFAULT_TIER', None),
+        small_input_tokens=getattr(settings, 'AI_TIER_SMALL_INPUT_TOKENS', 0),
+        latency_slo_ms=getattr(settings, 'AI_LATENCY_SLO_MS', {}),
+        default_slo_ms=getattr(settings, 'AI_DEFAULT_LATENCY_SLO_MS', 0),
+        window_seconds=getattr(settings, 'AI_TIER_LATENCY_WINDOW', 300),
+        min_samples=getattr(settings, 'AI_TIER_MIN_SAMPLES', 20),
+    )
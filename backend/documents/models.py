@@ -25,7 +25,10 @@ class Document(models.Model):
     original_filename = models.CharField(max_length=500)
     file = models.FileField(upload_to='documents/')
     file_size = models.BigIntegerField()
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the uploaded file
     pages = models.IntegerField(default=0)
+    chunks_ready = models.IntegerField(default=0)  # chunks persisted so far, readable while processing
+    checkpoint_page = models.IntegerField(default=0)  # last page whose chunks are fully persisted
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=UPLOADED)
     reading_mode = models.CharField(max_length=20, choices=READING_MODE_CHOICES, default='direct')
     metadata = models.JSONField(default=dict, blank=True)
@@ -38,6 +41,19 @@ class Document(models.Model):
     def __str__(self):
         return f"{self.title} ({self.reading_mode})"
 
+class DocumentPage(models.Model):
+    """Raw extracted text for one PDF page, so chunks can be rebuilt without re-parsing"""
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='page_texts')
+    page_number = models.IntegerField()
+    text = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['document', 'page_number']
+        unique_together = ['document', 'page_number']
+    
+    def __str__(self):
+        return f"Page {self.page_number} - {self.document.title}"
+
 class ContentChunk(models.Model):
     TEXT = 'text'
     IMAGE = 'image'
@@ -56,6 +72,7 @@ class ContentChunk(models.Model):
     image = models.ImageField(upload_to='chunk_images/', null=True, blank=True)
     reading_time = models.IntegerField(default=0)
     metadata = models.JSONField(default=dict, blank=True)
+    artifacts = models.JSONField(default=dict, blank=True)  # summary, key points, questions, rewrite
     
     class Meta:
         ordering = ['document', 'chunk_index']
@@ -108,4 +125,167 @@ class ReadingAnalytics(models.Model):
         unique_together = ['user', 'document']
     
     def __str__(self):
-        return f"{self.user.username} - {self.document.title} Analytics"
\ No newline at end of file
+        return f"{self.user.username} - {self.document.title} Analytics"
+class IngestionJob(models.Model):
+    PROCESS = 'process'
+    REPROCESS = 'reprocess'
+    PREFETCH_STORY = 'prefetch_story'
+    ENHANCE = 'enhance'
+    SUMMARIZE = 'summarize'
+    ARTIFACTS = 'artifacts'
+    
+    JOB_TYPES = [
+        (PROCESS, 'Process'),
+        (REPROCESS, 'Reprocess'),
+        (PREFETCH_STORY, 'Prefetch story'),
+        (ENHANCE, 'Enhance'),
+        (SUMMARIZE, 'Summarize'),
+        (ARTIFACTS, 'Artifacts'),
+    ]
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='ingestion_jobs')
+    job_type = models.CharField(max_length=20, choices=JOB_TYPES, default=PROCESS)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)  # higher runs first, e.g. a reader waiting on prefetch
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    timeout_seconds = models.IntegerField(default=600)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_after']),
+        ]
+    
+    def __str__(self):
+        return f"{self.job_type} job for {self.document.title} ({self.status})"
+
+class ChunkEnhancement(models.Model):
+    """Stored output of the enhance endpoint for one chunk and one reader profile"""
+    chunk = models.ForeignKey(ContentChunk, on_delete=models.CASCADE, related_name='enhancements')
+    interests_key = models.CharField(max_length=64)  # sha256 of the ordered interest list
+    reading_level = models.CharField(max_length=20)
+    prompt_version = models.IntegerField()
+    enhanced_content = models.TextField()
+    connections = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['chunk', 'interests_key', 'reading_level', 'prompt_version']
+    
+    def __str__(self):
+        return f"Enhancement of chunk {self.chunk_id} ({self.reading_level}, v{self.prompt_version})"
+
+class StoryTransformation(models.Model):
+    """Story text for one section, shared by every reader whose prompt would be identical"""
+    section_hash = models.CharField(max_length=64)  # sha256 of the cleaned section text
+    primary_interest = models.CharField(max_length=100)
+    reading_level = models.CharField(max_length=20)
+    prompt_version = models.IntegerField()
+    story = models.TextField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['section_hash', 'primary_interest', 'reading_level', 'prompt_version']
+    
+    def __str__(self):
+        return f"Story {self.section_hash[:12]} ({self.primary_interest}, {self.reading_level})"
+
+class AICallRecord(models.Model):
+    """One AI generation request: what it was for, how long it took and what it cost"""
+    STORY = 'story'
+    STORY_BATCH = 'story_batch'
+    ENHANCEMENT = 'enhancement'
+    CONNECTION = 'connection'
+    SUMMARY = 'summary'
+    KEY_POINTS = 'key_points'
+    QUESTIONS = 'questions'
+    RECOMMENDATIONS = 'recommendations'
+    READING_LEVEL = 'reading_level'
+    ARTIFACTS = 'artifacts'
+    OTHER = 'other'
+    
+    PROMPT_TYPES = [
+        (STORY, 'Story'),
+        (STORY_BATCH, 'Story batch'),
+        (ENHANCEMENT, 'Enhancement'),
+        (CONNECTION, 'Connection'),
+        (SUMMARY, 'Summary'),
+        (KEY_POINTS, 'Key points'),
+        (QUESTIONS, 'Questions'),
+        (RECOMMENDATIONS, 'Recommendations'),
+        (READING_LEVEL, 'Reading level'),
+        (ARTIFACTS, 'Artifacts'),
+        (OTHER, 'Other'),
+    ]
+    
+    SUCCESS = 'success'
+    CACHE_HIT = 'cache_hit'
+    FALLBACK = 'fallback'
+    UNAVAILABLE = 'unavailable'
+    ERROR = 'error'
+    
+    OUTCOMES = [
+        (SUCCESS, 'Success'),
+        (CACHE_HIT, 'Cache hit'),
+        (FALLBACK, 'Fallback'),
+        (UNAVAILABLE, 'Unavailable'),
+        (ERROR, 'Error'),
+    ]
+    
+    prompt_type = models.CharField(max_length=20, choices=PROMPT_TYPES, default=OTHER)
+    model_name = models.CharField(max_length=100)
+    tier = models.CharField(max_length=20, blank=True)  # model tier the request was routed to
+    route_reason = models.CharField(max_length=20, blank=True)  # task, small_input or slo_fallback
+    outcome = models.CharField(max_length=20, choices=OUTCOMES)
+    cache_hit = models.BooleanField(default=False)
+    latency_ms = models.FloatField(default=0)
+    input_tokens = models.IntegerField(default=0)
+    output_tokens = models.IntegerField(default=0)
+    cost_usd = models.FloatField(default=0)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='ai_calls')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['prompt_type', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.prompt_type} call ({self.outcome}, {self.latency_ms:.0f} ms)"
+
+class AIResponseCacheEntry(models.Model):
+    """Durable tier of the Gemini prompt/response cache"""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of model name + prompt
+    model_name = models.CharField(max_length=100)
+    response = models.TextField()
+    size = models.IntegerField(default=0)  # bytes of response, for size-based eviction
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    last_accessed_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.model_name} cache entry {self.key[:12]}"
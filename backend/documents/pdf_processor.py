@@ -1,61 +1,226 @@
-import pdfplumber
+import time
+from itertools import chain, islice
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .ai_processor import AIStoryTransformer
-from .models import Document, ContentChunk
+from .ai_provider import get_ai_transformer
+from .boilerplate import BoilerplateDetector
+from .concurrency import bounded_ordered_map
+from .extraction import PageExtractor
+from .models import Document, DocumentPage, ContentChunk
 
 class PDFProcessor:
     def __init__(self, document_id):
         self.document_id = document_id
         self.document = Document.objects.get(id=document_id)
-        self.ai_transformer = AIStoryTransformer()
+        self.ai_transformer = get_ai_transformer()
+        self.batch_size = getattr(settings, 'CHUNK_BATCH_SIZE', 20)
+        self.flush_interval = getattr(settings, 'CHUNK_FLUSH_INTERVAL', 2.0)
+        self.ai_concurrency = getattr(settings, 'AI_MAX_CONCURRENCY', 4)
+        self.batch_token_budget = getattr(settings, 'AI_STORY_BATCH_TOKENS', 0)
+        self.batch_max_sections = getattr(settings, 'AI_STORY_BATCH_MAX_SECTIONS', 8)
+        self.lazy_stories = self.document.metadata.get(
+            'story_generation', getattr(settings, 'STORY_GENERATION_MODE', 'eager')
+        ) == 'lazy'
+        self.boilerplate_threshold = getattr(settings, 'BOILERPLATE_THRESHOLD', 0.7)
+        self.boilerplate_sample_pages = getattr(settings, 'BOILERPLATE_SAMPLE_PAGES', 20)
+    
+    def iter_page_texts(self, after_page=0):
+        """Yield (page_number, text) for pages after after_page, parsing the PDF only on first ingestion"""
+        if self.has_page_layer(self.document) or self.copy_page_layer_from_duplicate():
+            pages = self.document.page_texts.filter(page_number__gt=after_page).order_by('page_number')
+            for page in pages.iterator():
+                yield page.page_number, page.text
+            return
+        
+        extractor = PageExtractor(self.document.file.path)
+        self.document.pages = extractor.page_count
+        self.document.save(update_fields=['pages'])
+        
+        started = time.perf_counter()
+        pending = []
+        for page_num, text in extractor.iter_pages():
+            pending.append(DocumentPage(document=self.document, page_number=page_num, text=text))
+            if len(pending) >= self.batch_size:
+                DocumentPage.objects.bulk_create(pending, ignore_conflicts=True)
+                pending = []
+            if page_num > after_page:
+                yield page_num, text
+        DocumentPage.objects.bulk_create(pending, ignore_conflicts=True)
+        elapsed = time.perf_counter() - started
+        
+        self.document.metadata['extraction'] = {
+            **extractor.stats(),
+            'pages': extractor.page_count,
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(extractor.page_count / elapsed, 2) if elapsed else None,
+        }
+    
+    def iter_clean_page_texts(self, after_page=0):
+        """Like iter_page_texts, with lines repeated across most pages (headers, footers) removed"""
+        if not self.boilerplate_threshold:
+            yield from self.iter_page_texts(after_page)
+            return
+        
+        detector = BoilerplateDetector(
+            threshold=self.boilerplate_threshold,
+            min_pages=getattr(settings, 'BOILERPLATE_MIN_PAGES', 8),
+            max_line_chars=getattr(settings, 'BOILERPLATE_MAX_LINE_CHARS', 200),
+        )
+        pages = self.iter_page_texts()
+        if self.boilerplate_sample_pages:
+            # Running headers show up on the leading pages, so cleaned pages can flow before the rest is read
+            sample = list(islice(pages, self.boilerplate_sample_pages))
+            for page_num, text in sample:
+                detector.observe(text)
+            pages = chain(sample, pages)
+        else:
+            # Full pass over every page first; this also builds the page layer on first ingestion
+            for page_num, text in pages:
+                detector.observe(text)
+            pages = self.iter_page_texts(after_page)
+        
+        for page_num, text in pages:
+            if page_num > after_page:
+                yield page_num, detector.clean(text)
+        self.document.metadata['boilerplate'] = detector.stats()
+    
+    def has_page_layer(self, document):
+        return document.pages > 0 and document.page_texts.count() == document.pages
+    
+    def copy_page_layer_from_duplicate(self):
+        """Reuse the stored page text of another upload of the same file"""
+        if not self.document.content_hash:
+            return False
+        
+        candidates = Document.objects.filter(
+            content_hash=self.document.content_hash, pages__gt=0
+        ).exclude(id=self.document.id)
+        for source in candidates:
+            if self.has_page_layer(source):
+                DocumentPage.objects.bulk_create([
+                    DocumentPage(document=self.document, page_number=page.page_number, text=page.text)
+                    for page in source.page_texts.all()
+                ], ignore_conflicts=True)
+                self.document.pages = source.pages
+                self.document.save(update_fields=['pages'])
+                return True
+        return False
+    
+    def iter_story_sections(self):
+        """Yield (page_number, section) for every section substantial enough to transform"""
+        for page_num, text in self.iter_clean_page_texts(after_page=self.document.checkpoint_page):
+            if text.strip():
+                # Split into logical sections for AI processing
+                for section in self.split_into_sections(text):
+                    if len(section.strip()) > 50:  # Only process substantial content
+                        yield page_num, section
+    
+    def iter_section_batches(self, items):
+        """Group (page_number, section) items into batches that fit the prompt token budget"""
+        batch, batch_tokens = [], 0
+        for item in items:
+            tokens = self.ai_transformer.estimate_tokens(self.ai_transformer.clean_text(item[1]))
+            if batch and (batch_tokens + tokens > self.batch_token_budget or len(batch) >= self.batch_max_sections):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            yield batch
     
     def process_story_mode(self):
-        """Enhanced story mode with AI transformation"""
-        chunks = []
-        chunk_index = 0
+        """Enhanced story mode with AI transformation, yields chunk dicts as they are ready"""
+        chunk_index = self.document.chunks_ready
         
-        with pdfplumber.open(self.document.file.path) as pdf:
-            self.document.pages = len(pdf.pages)
-            self.document.save()
-            
-            # Get user interests from profile
-            user_interests = self.get_user_interests()
-            reading_level = self.get_reading_level()
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text() or ""
-                
-                if text.strip():
-                    # Split into logical sections for AI processing
-                    sections = self.split_into_sections(text)
-                    
-                    for section in sections:
-                        if len(section.strip()) > 50:  # Only process substantial content
-                            # Transform with AI
-                            story_content = self.ai_transformer.transform_to_story(
-                                section, user_interests, reading_level
-                            )
-                            
-                            chunks.append({
-                                'chunk_index': chunk_index,
-                                'content_type': ContentChunk.TEXT,
-                                'content': story_content,
-                                'reading_time': self.estimate_reading_time(story_content),
-                                'metadata': {
-                                    'page_number': page_num,
-                                    'word_count': len(story_content.split()),
-                                    'char_count': len(story_content),
-                                    'chunk_type': 'ai_enhanced_story',
-                                    'reading_mode': 'story',
-                                    'is_enhanced': True,
-                                    'user_interests': user_interests,
-                                    'reading_level': reading_level,
-                                    'original_text_preview': section[:100] + '...' if len(section) > 100 else section
-                                }
-                            })
-                            chunk_index += 1
-        
-        return chunks
+        # Get user interests from profile
+        user_interests = self.get_user_interests()
+        reading_level = self.get_reading_level()
+        
+        if self.lazy_stories:
+            # Store raw sections only; story text is generated as the reader approaches them
+            for page_num, section in self.iter_story_sections():
+                yield self.build_story_chunk(chunk_index, page_num, section, None, user_interests, reading_level)
+                chunk_index += 1
+            return
+        
+        def transform(item):
+            page_num, section = item
+            return self.ai_transformer.transform_to_story(section, user_interests, reading_level)
+        
+        def transform_batch(batch):
+            sections = [section for page_num, section in batch]
+            return self.ai_transformer.transform_sections_batch(sections, user_interests, reading_level)
+        
+        # Sections are independent, so several model calls run at once; results come back in order
+        if self.batch_token_budget:
+            batches = bounded_ordered_map(
+                transform_batch, self.iter_section_batches(self.iter_story_sections()), self.ai_concurrency
+            )
+            transformed = (pair for batch, stories in batches for pair in zip(batch, stories))
+        else:
+            transformed = bounded_ordered_map(transform, self.iter_story_sections(), self.ai_concurrency)
+        
+        for (page_num, section), story_content in transformed:
+            yield self.build_story_chunk(chunk_index, page_num, section, story_content, user_interests, reading_level)
+            chunk_index += 1
+    
+    def build_story_chunk(self, chunk_index, page_num, section, story_content, user_interests, reading_level):
+        """Chunk dict for a story section; story_content=None stores the raw section for later generation"""
+        pending = story_content is None
+        content = section if pending else story_content
+        metadata = {
+            'page_number': page_num,
+            'word_count': len(content.split()),
+            'char_count': len(content),
+            'chunk_type': 'pending_story' if pending else 'ai_enhanced_story',
+            'reading_mode': 'story',
+            'is_enhanced': not pending,
+            'story_status': 'pending' if pending else 'generated',
+            'user_interests': user_interests,
+            'reading_level': reading_level,
+            'original_text_preview': section[:100] + '...' if len(section) > 100 else section
+        }
+        if pending:
+            metadata['source_text'] = section
+        
+        return {
+            'chunk_index': chunk_index,
+            'content_type': ContentChunk.TEXT,
+            'content': content,
+            'reading_time': self.estimate_reading_time(content),
+            'metadata': metadata
+        }
+    
+    def generate_pending_stories(self, start, count):
+        """Generate story text for pending chunks in [start, start + count), returns how many were filled"""
+        chunks = list(self.document.chunks.filter(
+            chunk_index__gte=start, chunk_index__lt=start + count, metadata__story_status='pending'
+        ))
+        
+        def transform(chunk):
+            metadata = chunk.metadata
+            return self.ai_transformer.transform_to_story(
+                metadata['source_text'], metadata['user_interests'], metadata['reading_level']
+            )
+        
+        for chunk, story_content in bounded_ordered_map(transform, chunks, self.ai_concurrency):
+            self.fill_story(chunk, story_content)
+        
+        ContentChunk.objects.bulk_update(chunks, ['content', 'reading_time', 'metadata'])
+        
+        return len(chunks)
+    
+    def fill_story(self, chunk, story_content):
+        """Replace a pending chunk's raw section with its generated story (not saved)"""
+        metadata = chunk.metadata
+        data = self.build_story_chunk(
+            chunk.chunk_index, metadata['page_number'], metadata['source_text'], story_content,
+            metadata['user_interests'], metadata['reading_level']
+        )
+        chunk.content = data['content']
+        chunk.reading_time = data['reading_time']
+        chunk.metadata = data['metadata']
     
     def get_user_interests(self):
         """Get user interests from profile"""
@@ -73,7 +238,8 @@ class PDFProcessor:
         except:
             return 'casual'  # Default level
     
-    def split_into_sections(self, text):
+    @staticmethod
+    def split_into_sections(text):
         """Split text into logical sections for AI processing"""
         # Split by paragraphs first
         paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
@@ -103,59 +269,142 @@ class PDFProcessor:
     def process_document(self):
         """Main method to process document based on reading mode"""
         try:
-            self.document.status = Document.PROCESSING
-            self.document.save()
+            resuming = self.document.checkpoint_page > 0 and self.document.status != Document.COMPLETED
+            if resuming:
+                # Anything past the checkpoint was written outside a committed batch
+                self.document.chunks.filter(chunk_index__gte=self.document.chunks_ready).delete()
+                print(f"⏯️ Resuming document {self.document.id} after page {self.document.checkpoint_page}")
+            else:
+                self.reset_progress()
             
+            self.document.status = Document.PROCESSING
+            self.document.metadata['personalization'] = self.personalization_key()
             if self.document.reading_mode == 'story':
-                chunks = self.process_story_mode()
-            else:
-                chunks = self.process_direct_mode()
+                self.document.metadata['story_generation'] = 'lazy' if self.lazy_stories else 'eager'
+            # Named fields only, so a reprocess request can't lose its reading_mode to this save
+            self.document.save(update_fields=['status', 'metadata', 'chunks_ready', 'checkpoint_page'])
             
-            # Save chunks to database
-            for chunk_data in chunks:
-                ContentChunk.objects.create(
-                    document=self.document,
-                    **chunk_data
-                )
+            source = None if resuming else self.find_reusable_document()
+            if source is not None:
+                self.clone_chunks_from(source)
+            elif self.document.reading_mode == 'story':
+                self.persist_chunks(self.process_story_mode())
+            else:
+                self.persist_chunks(self.process_direct_mode())
             
             self.document.status = Document.COMPLETED
             self.document.processed_at = timezone.now()
-            self.document.save()
+            self.document.save(update_fields=['status', 'processed_at', 'pages', 'metadata'])
             
         except Exception as e:
             self.document.status = Document.FAILED
-            self.document.save()
+            self.document.save(update_fields=['status'])
             raise e
     
-    def process_direct_mode(self):
-        """Process document in direct reading mode"""
+    def reset_progress(self):
+        """Drop chunks and checkpoints so the document is rebuilt from page 1"""
+        self.document.chunks.all().delete()
+        self.document.chunks_ready = 0
+        self.document.checkpoint_page = 0
+    
+    def persist_chunks(self, chunks):
+        """Persist chunks in page-aligned batches so readers can start early and a crash can resume"""
+        batch = []
+        last_flush = time.monotonic()
+        for chunk_data in chunks:
+            page_num = chunk_data['metadata']['page_number']
+            # Only flush at a page boundary so the checkpoint never splits a page
+            if batch and page_num != batch[-1].metadata['page_number'] and (
+                len(batch) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval
+            ):
+                self.save_chunk_batch(batch, checkpoint_page=page_num - 1)
+                batch = []
+                last_flush = time.monotonic()
+            batch.append(ContentChunk(document=self.document, **chunk_data))
+        self.save_chunk_batch(batch, checkpoint_page=self.document.pages)
+    
+    def personalization_key(self):
+        """Inputs besides the file that change the generated chunks"""
+        if self.document.reading_mode != 'story':
+            return {}
+        interests = self.get_user_interests()
+        return {
+            'primary_interest': interests[0] if interests else 'general',
+            'reading_level': self.get_reading_level(),
+            # A lazy copy holds pending raw sections that an eager document would never generate
+            'story_generation': 'lazy' if self.lazy_stories else 'eager',
+        }
+    
+    def find_reusable_document(self):
+        """Find an already processed copy of the same file with identical output settings"""
+        if not self.document.content_hash:
+            return None
+        
+        return Document.objects.filter(
+            content_hash=self.document.content_hash,
+            reading_mode=self.document.reading_mode,
+            status=Document.COMPLETED,
+            metadata__personalization=self.document.metadata['personalization'],
+        ).exclude(id=self.document.id).order_by('-processed_at').first()
+    
+    def clone_chunks_from(self, source):
+        """Copy another document's chunks instead of re-extracting and re-generating them"""
+        user_interests = self.get_user_interests()
         chunks = []
-        chunk_index = 0
+        for chunk in source.chunks.all().iterator():
+            metadata = dict(chunk.metadata)
+            if 'user_interests' in metadata:
+                metadata['user_interests'] = user_interests
+            chunks.append(ContentChunk(
+                document=self.document,
+                chunk_index=chunk.chunk_index,
+                content_type=chunk.content_type,
+                content=chunk.content,
+                image=chunk.image,
+                reading_time=chunk.reading_time,
+                metadata=metadata,
+                artifacts=chunk.artifacts,
+            ))
         
-        with pdfplumber.open(self.document.file.path) as pdf:
-            self.document.pages = len(pdf.pages)
-            self.document.save()
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                text = page.extract_text() or ""
-                
-                if text.strip():
-                    chunks.append({
-                        'chunk_index': chunk_index,
-                        'content_type': ContentChunk.TEXT,
-                        'content': text,
-                        'reading_time': self.estimate_reading_time(text),
-                        'metadata': {
-                            'page_number': page_num,
-                            'word_count': len(text.split()),
-                            'char_count': len(text),
-                            'chunk_type': 'direct_text',
-                            'reading_mode': 'direct'
-                        }
-                    })
-                    chunk_index += 1
-        
-        return chunks
+        self.document.pages = source.pages
+        self.document.metadata['cloned_from'] = source.id
+        
+        # Page checkpoint stays at 0 until the last batch, so an interrupted clone starts over
+        for start in range(0, len(chunks), self.batch_size):
+            is_last = start + self.batch_size >= len(chunks)
+            self.save_chunk_batch(chunks[start:start + self.batch_size],
+                                  checkpoint_page=source.pages if is_last else 0)
+    
+    def save_chunk_batch(self, batch, checkpoint_page):
+        """Insert a batch of chunks and advance the readable high-water mark and page checkpoint"""
+        with transaction.atomic():
+            if batch:
+                # unique_together on (document, chunk_index) makes a replayed batch a no-op
+                ContentChunk.objects.bulk_create(batch, ignore_conflicts=True)
+                self.document.chunks_ready = batch[-1].chunk_index + 1
+            self.document.checkpoint_page = checkpoint_page
+            self.document.save(update_fields=['chunks_ready', 'checkpoint_page'])
+    
+    def process_direct_mode(self):
+        """Process document in direct reading mode, yields chunk dicts page by page"""
+        chunk_index = self.document.chunks_ready
+        
+        for page_num, text in self.iter_clean_page_texts(after_page=self.document.checkpoint_page):
+            if text.strip():
+                yield {
+                    'chunk_index': chunk_index,
+                    'content_type': ContentChunk.TEXT,
+                    'content': text,
+                    'reading_time': self.estimate_reading_time(text),
+                    'metadata': {
+                        'page_number': page_num,
+                        'word_count': len(text.split()),
+                        'char_count': len(text),
+                        'chunk_type': 'direct_text',
+                        'reading_mode': 'direct'
+                    }
+                }
+                chunk_index += 1
     
     def estimate_reading_time(self, text):
         """Estimate reading time in seconds (average 200 words per minute)"""
@@ -1,10 +1,10 @@
 from rest_framework import serializers
-from .models import Document, ContentChunk, ReadingSession, Bookmark, ReadingAnalytics
+from .models import Document, ContentChunk, ReadingSession, Bookmark, ReadingAnalytics, IngestionJob
 
 class ContentChunkSerializer(serializers.ModelSerializer):
     class Meta:
         model = ContentChunk
-        fields = '__all__'
+        exclude = ('artifacts',)  # served by the artifacts endpoints instead
 
 class DocumentSerializer(serializers.ModelSerializer):
     chunks = ContentChunkSerializer(many=True, read_only=True)
@@ -12,7 +12,7 @@ class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = '__all__'
-        read_only_fields = ('user', 'status', 'processed_at', 'metadata', 'pages')
+        read_only_fields = ('user', 'status', 'processed_at', 'metadata', 'pages', 'chunks_ready', 'checkpoint_page', 'content_hash')
 
 class DocumentUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
@@ -57,4 +57,10 @@ class ProgressUpdateSerializer(serializers.Serializer):
     current_chunk = serializers.IntegerField(min_value=0)
     time_spent = serializers.IntegerField(min_value=0)
     reading_speed_wpm = serializers.IntegerField(min_value=50, max_value=1000, required=False)
-    device_info = serializers.JSONField(required=False)
\ No newline at end of file
+    device_info = serializers.JSONField(required=False)
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionJob
+        fields = ('id', 'job_type', 'status', 'attempts', 'max_attempts', 'timeout_seconds',
+                  'run_after', 'last_error', 'created_at', 'started_at', 'finished_at')
\ No newline at end of file
@@ -0,0 +1,40 @@
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+
+def content_addressed_name(content_hash, extension='.pdf'):
+    """Storage path for a file identified by its SHA-256 digest"""
+    return f"documents/{content_hash[:2]}/{content_hash}{extension}"
+
+
+def store_upload(uploaded_file):
+    """Stream an upload to disk while hashing it, storing each distinct file once.
+
+    Returns (storage_name, sha256_hex). When a file with the same digest is
+    already stored, the new copy is discarded and the existing name is reused.
+    """
+    hasher = hashlib.sha256()
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT, suffix='.upload', delete=False) as tmp:
+        try:
+            for block in uploaded_file.chunks():
+                hasher.update(block)
+                tmp.write(block)
+            tmp.flush()
+
+            content_hash = hasher.hexdigest()
+            extension = os.path.splitext(uploaded_file.name)[1].lower() or '.pdf'
+            name = content_addressed_name(content_hash, extension)
+
+            if not default_storage.exists(name):
+                tmp.seek(0)
+                name = default_storage.save(name, File(tmp, name=name))
+        finally:
+            os.unlink(tmp.name)
+
+    return name, content_hash
@@ -0,0 +1,30 @@
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+from .models import StoryTransformation
+
+
+def find_stored_story(key):
+    """Story text stored under key (see AIStoryTransformer.story_key), or None"""
+    try:
+        story = StoryTransformation.objects.filter(**key).values_list('story', flat=True).first()
+    except DatabaseError as e:
+        # Treated as not stored: the story is generated again instead of failing the reader or the job
+        print(f"⚠️ Story store read skipped: {e}")
+        return None
+    if story is not None:
+        try:
+            StoryTransformation.objects.filter(**key).update(hits=F('hits') + 1)
+        except DatabaseError as e:
+            print(f"⚠️ Story store hit count skipped: {e}")
+    return story
+
+
+def store_story(key, story):
+    """Save a generated story for every later reader with the same key"""
+    try:
+        StoryTransformation.objects.create(story=story, **key)
+    except IntegrityError:
+        pass  # generated concurrently by another worker, which stored the same prompt's output
+    except DatabaseError as e:
+        # The reader still gets the story; only the sharing is lost
+        print(f"⚠️ Story store write skipped: {e}")
@@ -1,4 +1,4 @@
-from .ai_processor import AIStoryTransformer
+from .ai_provider import get_ai_transformer
 from .models import Document, ContentChunk
 from django.conf import settings
 
@@ -6,7 +6,7 @@ class StoryTransformationEngine:
     """Core engine for transforming documents into personalized stories"""
     
     def __init__(self):
-        self.ai_processor = AIStoryTransformer()
+        self.ai_processor = get_ai_transformer()
     
     def transform_document(self, document, user_profile):
         """Transform entire document based on user interests and reading level"""
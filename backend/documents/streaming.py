@@ -0,0 +1,175 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .ai_context import ai_call_context
+from .ai_provider import get_ai_transformer
+from .ai_resilience import AIUnavailableError
+from .enhancements import ENHANCEMENT_PARTS, find_enhancement, interests_key, store_enhancement
+from .models import AICallRecord, ChunkEnhancement, ContentChunk
+from .pdf_processor import PDFProcessor
+from .story_store import store_story
+
+
+PART_PROMPT_TYPES = {
+    'enhanced_content': AICallRecord.ENHANCEMENT,
+    'connections': AICallRecord.CONNECTION,
+}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def iterate_in_thread(iterator):
+    """Drive a blocking iterator from async code, one item per worker-thread hop"""
+    done = object()
+    next_item = sync_to_async(next, thread_sensitive=False)
+    try:
+        while True:
+            item = await next_item(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # Closing the generator on disconnect stops the upstream model stream too
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=False)()
+
+
+async def authenticate(request):
+    """Resolve the JWT user for a plain Django async view, None when unauthenticated"""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def load_chunk(request, pk):
+    """Return (chunk, profile, error_response) for the requesting user's chunk"""
+    user = await authenticate(request)
+    if user is None:
+        return None, None, JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    chunk = await sync_to_async(
+        ContentChunk.objects.filter(pk=pk, document__user=user).select_related('document').first
+    )()
+    if chunk is None:
+        return None, None, JsonResponse({'detail': 'Not found.'}, status=404)
+    profile = await sync_to_async(lambda: user.profile)()
+    return chunk, profile, None
+
+
+def sse_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # keep nginx from buffering the stream
+    return response
+
+
+async def stream_prompt(part, prompt, texts, prompt_type, document):
+    """Forward one model stream as delta events, collecting the full text into texts[part]"""
+    pieces = []
+    stream = get_ai_transformer().stream_with_gemini(prompt, prompt_type=prompt_type)
+    # Each step runs in a worker thread with a copy of this context, so call records get the document
+    # and the scheduler queues the call under the reader
+    with ai_call_context(document_id=document.id, user_id=document.user_id):
+        async for piece in iterate_in_thread(stream):
+            pieces.append(piece)
+            yield sse_event('delta', {'part': part, 'text': piece})
+    texts[part] = ''.join(pieces).strip()
+
+
+async def enhancement_events(chunk, interests, reading_level):
+    stored = await sync_to_async(find_enhancement)(chunk, interests, reading_level)
+    if stored is not None:
+        for part in ENHANCEMENT_PARTS:
+            yield sse_event('delta', {'part': part, 'text': getattr(stored, part)})
+        yield sse_event('done', {'stored': True})
+        return
+
+    ai_transformer = get_ai_transformer()
+    prompts = {
+        'enhanced_content': ai_transformer.create_enhancement_prompt(chunk.content, interests, reading_level),
+        'connections': ai_transformer.create_connection_prompt(chunk.content, interests),
+    }
+    texts = {}
+    try:
+        for part in ENHANCEMENT_PARTS:
+            async for event in stream_prompt(
+                part, prompts[part], texts, PART_PROMPT_TYPES[part], chunk.document
+            ):
+                yield event
+    except AIUnavailableError as e:
+        yield sse_event('error', {'status': 'ai_unavailable', 'error': str(e), 'retry_after': e.retry_after})
+        return
+
+    enhancement = ChunkEnhancement(
+        chunk=chunk,
+        interests_key=interests_key(interests),
+        reading_level=reading_level,
+        prompt_version=ai_transformer.ENHANCEMENT_PROMPT_VERSION,
+        **texts,
+    )
+    saved = await sync_to_async(store_enhancement)(enhancement)
+    yield sse_event('done', {'stored': saved is not None})
+
+
+def save_streamed_story(chunk_id, story_content):
+    """Persist a streamed story unless the chunk was filled meanwhile, returns True when saved"""
+    chunk = ContentChunk.objects.get(id=chunk_id)
+    if chunk.metadata.get('story_status') != 'pending':
+        return False
+    if story_content == get_ai_transformer().create_fallback():
+        return False
+    PDFProcessor(chunk.document_id).fill_story(chunk, story_content)
+    chunk.save(update_fields=['content', 'reading_time', 'metadata'])
+    return True
+
+
+async def story_events(chunk):
+    metadata = chunk.metadata
+    if metadata.get('story_status') != 'pending':
+        yield sse_event('delta', {'part': 'content', 'text': chunk.content})
+        yield sse_event('done', {'stored': True})
+        return
+
+    ai_transformer = get_ai_transformer()
+    cleaned_text = ai_transformer.clean_text(metadata['source_text'])
+    key = ai_transformer.story_key(cleaned_text, metadata['user_interests'], metadata['reading_level'])
+    with ai_call_context(document_id=chunk.document_id):
+        texts = {'content': await sync_to_async(ai_transformer.find_story)(key)}
+    if texts['content'] is not None:
+        # Another reader with the same profile already generated this section
+        yield sse_event('delta', {'part': 'content', 'text': texts['content']})
+    else:
+        prompt = ai_transformer.create_story_prompt(cleaned_text, metadata['user_interests'], metadata['reading_level'])
+        try:
+            async for event in stream_prompt('content', prompt, texts, AICallRecord.STORY, chunk.document):
+                yield event
+        except AIUnavailableError as e:
+            yield sse_event('error', {'status': 'ai_unavailable', 'error': str(e), 'retry_after': e.retry_after})
+            return
+        if texts['content'] != ai_transformer.create_fallback():
+            await sync_to_async(store_story)(key, texts['content'])
+
+    saved = await sync_to_async(save_streamed_story)(chunk.id, texts['content'])
+    yield sse_event('done', {'stored': saved})
+
+
+async def stream_chunk_enhancement(request, pk):
+    """SSE stream of the chunk's enhancement, stored once the stream completes"""
+    chunk, profile, error = await load_chunk(request, pk)
+    if error is not None:
+        return error
+    return sse_response(enhancement_events(chunk, profile.interests, profile.reading_level))
+
+
+async def stream_chunk_story(request, pk):
+    """SSE stream of a pending story chunk's text, saved to the chunk once complete"""
+    chunk, profile, error = await load_chunk(request, pk)
+    if error is not None:
+        return error
+    return sse_response(story_events(chunk))
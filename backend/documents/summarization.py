@@ -0,0 +1,120 @@
+import hashlib
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .ai_provider import get_ai_transformer
+from .concurrency import bounded_ordered_map
+from .models import ContentChunk
+
+
+def text_hash(*parts):
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class DocumentSummarizer:
+    """Map-reduce summary of a whole document.
+
+    Map: every chunk is summarized on its own, in parallel, and the result is
+    kept in the chunk's metadata with a hash of its source text. Reduce:
+    summaries are combined fan_in at a time, level by level, until one is
+    left. Each reduce node is stored by the hash of its inputs, so after a
+    few chunks change only the nodes above them are regenerated.
+    """
+
+    def __init__(self, document, fan_in=None, max_in_flight=None):
+        self.document = document
+        self.ai_transformer = get_ai_transformer()
+        self.fan_in = max(2, fan_in or getattr(settings, 'SUMMARY_FAN_IN', 8))
+        self.max_in_flight = max_in_flight or getattr(settings, 'AI_MAX_CONCURRENCY', 4)
+        self.chunk_words = getattr(settings, 'SUMMARY_CHUNK_WORDS', 80)
+        self.version = str(self.ai_transformer.SUMMARY_PROMPT_VERSION)
+        self.generated = {'chunks': 0, 'nodes': 0}
+
+    def summarize(self):
+        """Build the summary and key points and store them in Document.metadata['summary']"""
+        summaries = self.map_chunks()
+        previous_nodes = self.document.metadata.get('summary', {}).get('nodes', {})
+        nodes = {}
+        levels = 0
+        while len(summaries) > 1:
+            summaries = self.reduce_level(summaries, previous_nodes, nodes)
+            levels += 1
+
+        summary = summaries[0] if summaries else ''
+        key_points = self.ai_transformer.extract_key_points(summary) if summary else ''
+        self.document.metadata['summary'] = {
+            'text': summary,
+            'key_points': key_points,
+            'chunks': self.document.chunks.count(),
+            'levels': levels,
+            'prompt_version': self.ai_transformer.SUMMARY_PROMPT_VERSION,
+            'generated': self.generated,
+            'generated_at': timezone.now().isoformat(),
+            'nodes': nodes,
+        }
+        self.document.save(update_fields=['metadata'])
+        return self.document.metadata['summary']
+
+    def map_chunks(self):
+        """Per-chunk summaries in chunk order, generating only those whose source changed"""
+        chunks = list(self.document.chunks.order_by('chunk_index'))
+        stale = []
+        for chunk in chunks:
+            cached = chunk.metadata.get('summary') or {}
+            if cached.get('hash') != self.chunk_hash(chunk):
+                stale.append(chunk)
+
+        fallback = self.ai_transformer.create_fallback()
+        summarize = lambda chunk: self.ai_transformer.generate_summary(self.source_text(chunk), self.chunk_words)
+        for chunk, summary in bounded_ordered_map(summarize, stale, self.max_in_flight):
+            if summary != fallback:
+                self.save_chunk_summary(chunk, {'hash': self.chunk_hash(chunk), 'text': summary})
+                self.generated['chunks'] += 1
+
+        # A chunk whose summary failed falls back to its own text rather than dropping out
+        return [
+            (chunk.metadata.get('summary') or {}).get('text') or self.source_text(chunk)
+            for chunk in chunks
+        ]
+
+    def save_chunk_summary(self, chunk, summary):
+        """Set the summary key on the stored metadata, so a story filled meanwhile is not written back over"""
+        with transaction.atomic():
+            current = ContentChunk.objects.select_for_update().only('id', 'metadata').filter(id=chunk.id).first()
+            if current is None:
+                return  # deleted by a reprocess meanwhile
+            current.metadata['summary'] = summary
+            current.save(update_fields=['metadata'])
+        chunk.metadata = current.metadata
+
+    def reduce_level(self, summaries, previous_nodes, nodes):
+        """Combine summaries fan_in at a time, reusing nodes whose inputs are unchanged"""
+        groups = [summaries[i:i + self.fan_in] for i in range(0, len(summaries), self.fan_in)]
+        keys = [text_hash(self.version, *group) for group in groups]
+
+        stale = [(key, group) for key, group in zip(keys, groups) if key not in previous_nodes and len(group) > 1]
+        fallback = self.ai_transformer.create_fallback()
+        combine = lambda item: self.ai_transformer.combine_summaries(item[1])
+        for (key, group), combined in bounded_ordered_map(combine, stale, self.max_in_flight):
+            if combined != fallback:
+                previous_nodes[key] = combined
+                self.generated['nodes'] += 1
+
+        results = []
+        for key, group in zip(keys, groups):
+            if len(group) == 1:
+                results.append(group[0])
+            elif key in previous_nodes:
+                nodes[key] = previous_nodes[key]
+                results.append(previous_nodes[key])
+            else:
+                # Failed node: pass its inputs up joined so the next level still sees them
+                results.append(' '.join(group))
+        return results
+
+    def source_text(self, chunk):
+        # Lazy story chunks keep the original section; generated stories are summarized as written
+        return chunk.metadata.get('source_text') or chunk.content
+
+    def chunk_hash(self, chunk):
+        return text_hash(self.version, self.source_text(chunk))
@@ -1,3 +1,817 @@
-from django.test import TestCase
+from datetime import timedelta
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from unittest import mock
+from django.db import OperationalError
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import ai_cache, ai_metrics, ai_provider, ai_resilience, ai_scheduler
+from .ai_backends import FakeBackend
+from .ai_processor import AIStoryTransformer
+from .ai_resilience import AIUnavailableError, CircuitBreaker, TokenBucketLimiter
+from .artifacts import generate_chunk_artifacts
+from .boilerplate import BoilerplateDetector
+from .enhancements import get_or_create_enhancement
+from .ingestion import IngestionWorker, enqueue_document, enqueue_story_prefetch
+from .model_router import SLO_FALLBACK, SMALL_INPUT, TASK, ModelRouter
+from .models import (AICallRecord, AIResponseCacheEntry, ChunkEnhancement, ContentChunk, Document, DocumentPage,
+                     IngestionJob)
+from .pdf_processor import PDFProcessor
+from .story_store import find_stored_story, store_story
+from .streaming import save_streamed_story
+from .summarization import DocumentSummarizer
+from users.models import User
 
-# Create your tests here.
+
+def create_document(**fields):
+    user, _ = User.objects.get_or_create(email='reader@example.com', defaults={'username': 'reader'})
+    return Document.objects.create(**{
+        'user': user,
+        'title': 'Test document',
+        'original_filename': 'test.pdf',
+        'file': 'documents/test.pdf',
+        'file_size': 1,
+        **fields,
+    })
+
+
+# Offline, deterministic AI: no quota, cache or call records unless a test turns them on
+FAKE_AI = {
+    'AI_BACKEND': 'fake',
+    'AI_FAKE_LATENCY_MS': 0,
+    'AI_FAKE_LATENCY_DISTRIBUTION': 'fixed',
+    'AI_FAKE_ERROR_RATE': 0,
+    'AI_REQUESTS_PER_MINUTE': 0,
+    'AI_TOKENS_PER_MINUTE': 0,
+    'AI_CACHE_ENABLED': False,
+    'AI_METRICS_ENABLED': False,
+    'AI_MAX_RETRIES': 0,
+}
+
+
+def reset_ai_singletons():
+    """Drop the per-process AI objects so the next call picks up overridden settings"""
+    ai_provider.reset_ai_transformer()
+    ai_cache._response_cache = None
+    ai_metrics._recorder = None
+    ai_resilience._rate_limiter = None
+    ai_resilience._circuit_breaker = None
+    ai_scheduler._scheduler = None
+
+
+class FakeAITestCase(TestCase):
+    """TestCase whose AI calls go to the fake backend"""
+    ai_settings = {}
+
+    def setUp(self):
+        override = override_settings(**{**FAKE_AI, **self.ai_settings})
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_ai_singletons()
+        self.addCleanup(reset_ai_singletons)
+
+    def create_pending_chunks(self, document, count):
+        processor = PDFProcessor(document.id)
+        for index in range(count):
+            section = f'Section {index} explains how careful readers connect one idea to the next.'
+            ContentChunk.objects.create(document=document, **processor.build_story_chunk(
+                index, 1, section, None, ['science'], 'casual'
+            ))
+
+
+@override_settings(INGESTION_RETRY_BACKOFF=30, INGESTION_MAX_ATTEMPTS=2)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.worker = IngestionWorker(name='test')
+        self.document = create_document()
+
+    def test_oldest_ready_job_is_claimed(self):
+        first = enqueue_document(self.document)
+        enqueue_document(self.document)
+
+        job = self.worker.claim_next_job()
+        self.assertEqual(job.id, first.id)
+        self.assertEqual((job.status, job.attempts, job.locked_by), (IngestionJob.RUNNING, 1, 'test'))
+
+    def test_higher_priority_job_is_claimed_first(self):
+        enqueue_document(self.document)
+        prefetch = enqueue_document(self.document, IngestionJob.PREFETCH_STORY)
+        prefetch.priority = 10
+        prefetch.save(update_fields=['priority'])
+
+        self.assertEqual(self.worker.claim_next_job().id, prefetch.id)
+
+    def test_users_with_fewer_running_jobs_go_first(self):
+        other_user = User.objects.create(email='other@example.com', username='other')
+        other_document = create_document(user=other_user)
+        IngestionJob.objects.create(document=self.document, job_type=IngestionJob.PROCESS,
+                                    status=IngestionJob.RUNNING, locked_at=timezone.now())
+        enqueue_document(self.document)
+        other_job = enqueue_document(other_document)
+
+        self.assertEqual(self.worker.claim_next_job().id, other_job.id)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        enqueue_document(self.document)
+        self.assertIsNotNone(self.worker.claim_next_job())
+        self.assertIsNone(IngestionWorker(name='second').claim_next_job())
+
+    def run_failing_job(self, error):
+        with mock.patch.dict(self.worker.handlers, {IngestionJob.PROCESS: mock.Mock(side_effect=error)}):
+            self.worker.run_job(self.worker.claim_next_job())
+
+    def test_failed_job_is_retried_with_backoff_then_given_up(self):
+        job = enqueue_document(self.document)
+        self.run_failing_job(ValueError('boom'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), (IngestionJob.QUEUED, 1, 'boom'))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=25))
+        self.assertIsNone(self.worker.claim_next_job())
+
+        IngestionJob.objects.filter(id=job.id).update(run_after=timezone.now())
+        self.run_failing_job(ValueError('boom'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (IngestionJob.FAILED, 2))
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, Document.FAILED)
+
+    def test_unavailable_ai_defers_without_spending_an_attempt(self):
+        job = enqueue_document(self.document)
+        self.run_failing_job(AIUnavailableError('AI rate limit reached', retry_after=120))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (IngestionJob.QUEUED, 0))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=115))
+
+
+@override_settings(STORY_PREFETCH_WINDOW=5)
+class StoryPrefetchTests(TestCase):
+
+    def setUp(self):
+        self.document = create_document(reading_mode='story', metadata={'story_generation': 'lazy'})
+        for index in range(10):
+            ContentChunk.objects.create(document=self.document, chunk_index=index, content_type=ContentChunk.TEXT,
+                                        content=f'Section {index}', metadata={'story_status': 'pending'})
+
+    def test_prefetch_is_queued_ahead_of_ingestion(self):
+        job = enqueue_story_prefetch(self.document, 3)
+        self.assertEqual((job.job_type, job.priority), (IngestionJob.PREFETCH_STORY, 10))
+        self.assertEqual(job.payload, {'start': 3, 'count': 5})
+
+    def test_waiting_prefetch_moves_to_the_newest_window(self):
+        first = enqueue_story_prefetch(self.document, 0)
+        second = enqueue_story_prefetch(self.document, 5)
+
+        self.assertEqual(second.id, first.id)
+        first.refresh_from_db()
+        self.assertEqual(first.payload['start'], 5)
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    def test_running_prefetch_is_not_duplicated(self):
+        running = enqueue_story_prefetch(self.document, 3)
+        IngestionJob.objects.update(status=IngestionJob.RUNNING)
+
+        self.assertEqual(enqueue_story_prefetch(self.document, 3).id, running.id)
+        self.assertEqual(IngestionJob.objects.count(), 1)
+        # Only the chunks past the running window are queued
+        job = enqueue_story_prefetch(self.document, 5)
+        self.assertNotEqual(job.id, running.id)
+        self.assertEqual(job.payload, {'start': 8, 'count': 2})
+
+    def test_nothing_is_queued_once_stories_are_ready(self):
+        self.document.chunks.update(metadata={'story_status': 'ready'})
+        self.assertIsNone(enqueue_story_prefetch(self.document, 0))
+
+
+@mock.patch('documents.pdf_processor.get_ai_transformer', mock.Mock())
+class DocumentReuseTests(TestCase):
+    personalization = {'primary_interest': 'technology', 'reading_level': 'casual', 'story_generation': 'eager'}
+
+    def create_source(self, **fields):
+        source = create_document(**{
+            'content_hash': 'a' * 64, 'reading_mode': 'story', 'status': Document.COMPLETED, 'pages': 2,
+            'metadata': {'personalization': self.personalization}, 'processed_at': timezone.now(), **fields,
+        })
+        for index in range(3):
+            ContentChunk.objects.create(document=source, chunk_index=index, content_type=ContentChunk.TEXT,
+                                        content=f'Story {index}', metadata={'user_interests': ['technology']})
+        return source
+
+    def create_copy(self, **fields):
+        other_user, _ = User.objects.get_or_create(email='other@example.com', defaults={'username': 'other'})
+        return create_document(**{'user': other_user, 'content_hash': 'a' * 64, 'reading_mode': 'story', **fields})
+
+    def test_processed_copy_of_the_same_file_is_cloned(self):
+        source = self.create_source()
+        document = self.create_copy()
+        PDFProcessor(document.id).process_document()
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, Document.COMPLETED)
+        self.assertEqual((document.chunks_ready, document.pages), (3, 2))
+        self.assertEqual(document.metadata['cloned_from'], source.id)
+        self.assertEqual(list(document.chunks.order_by('chunk_index').values_list('content', flat=True)),
+                         ['Story 0', 'Story 1', 'Story 2'])
+
+    def find_reusable(self, document):
+        processor = PDFProcessor(document.id)
+        processor.document.metadata['personalization'] = processor.personalization_key()
+        return processor.find_reusable_document()
+
+    def test_copy_with_other_personalization_is_not_reused(self):
+        self.create_source(metadata={'personalization': {**self.personalization, 'primary_interest': 'history'}})
+        self.assertIsNone(self.find_reusable(self.create_copy()))
+
+    def test_unfinished_or_other_mode_copies_are_not_reused(self):
+        self.create_source(status=Document.PROCESSING)
+        self.create_source(reading_mode='direct')
+        self.assertIsNone(self.find_reusable(self.create_copy()))
+
+    def test_eager_document_does_not_clone_pending_chunks_of_lazy_copy(self):
+        lazy = self.create_source(metadata={'story_generation': 'lazy'})
+        lazy.metadata['personalization'] = PDFProcessor(lazy.id).personalization_key()
+        lazy.save(update_fields=['metadata'])
+        self.assertIsNone(self.find_reusable(self.create_copy(metadata={'story_generation': 'eager'})))
+        self.assertEqual(self.find_reusable(self.create_copy(metadata={'story_generation': 'lazy'})), lazy)
+
+
+@mock.patch('documents.pdf_processor.get_ai_transformer', mock.Mock())
+@override_settings(CHUNK_BATCH_SIZE=2, CHUNK_FLUSH_INTERVAL=3600)
+class ResumeIngestionTests(TestCase):
+    topics = ['Tides', 'Orbits', 'Comets', 'Eclipses', 'Nebulae', 'Quasars', 'Pulsars', 'Auroras', 'Meteors', 'Galaxies']
+
+    def setUp(self):
+        # A stored page layer stands in for the PDF, one direct-mode chunk per page
+        self.document = create_document(pages=len(self.topics))
+        DocumentPage.objects.bulk_create([
+            DocumentPage(document=self.document, page_number=number, text=f'{topic} are explained here.')
+            for number, topic in enumerate(self.topics, 1)
+        ])
+
+    def test_interrupted_document_resumes_without_duplicate_or_missing_chunks(self):
+        save_chunk_batch = PDFProcessor.save_chunk_batch
+        saved = []
+
+        def crash_after_three_batches(processor, *args, **kwargs):
+            if len(saved) == 3:
+                raise RuntimeError('worker killed')
+            saved.append(args)
+            return save_chunk_batch(processor, *args, **kwargs)
+
+        with mock.patch.object(PDFProcessor, 'save_chunk_batch', crash_after_three_batches):
+            with self.assertRaises(RuntimeError):
+                PDFProcessor(self.document.id).process_document()
+
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.checkpoint_page, self.document.chunks_ready), (6, 6))
+        # Written after the last committed batch, so the resume must drop it
+        ContentChunk.objects.create(document=self.document, chunk_index=6, content_type=ContentChunk.TEXT,
+                                    content='Half-written chunk', metadata={'page_number': 7})
+
+        PDFProcessor(self.document.id).process_document()
+
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, Document.COMPLETED)
+        self.assertEqual(self.document.chunks_ready, len(self.topics))
+        chunks = list(self.document.chunks.order_by('chunk_index'))
+        self.assertEqual([chunk.chunk_index for chunk in chunks], list(range(len(self.topics))))
+        self.assertEqual([chunk.metadata['page_number'] for chunk in chunks], list(range(1, len(self.topics) + 1)))
+        self.assertEqual([chunk.content.split()[0] for chunk in chunks], self.topics)
+
+    def test_batches_are_flushed_only_at_page_boundaries(self):
+        processor = PDFProcessor(self.document.id)
+        pages = [1, 1, 1, 2, 2, 2, 3]
+        chunks = (
+            {'chunk_index': index, 'content_type': ContentChunk.TEXT, 'content': f'Chunk {index}',
+             'metadata': {'page_number': page}}
+            for index, page in enumerate(pages)
+        )
+        with mock.patch.object(processor, 'save_chunk_batch', wraps=processor.save_chunk_batch) as save:
+            processor.persist_chunks(chunks)
+
+        flushed = [([chunk.metadata['page_number'] for chunk in call.args[0]], call.kwargs['checkpoint_page'])
+                   for call in save.call_args_list]
+        self.assertEqual(flushed, [([1, 1, 1], 1), ([2, 2, 2], 2), ([3], len(self.topics))])
+
+
+@mock.patch('documents.pdf_processor.get_ai_transformer', mock.Mock())
+class ReprocessTests(TestCase):
+    def setUp(self):
+        self.document = create_document(status=Document.COMPLETED, pages=1, chunks_ready=1, checkpoint_page=1)
+        DocumentPage.objects.create(document=self.document, page_number=1, text='Tides are explained here.')
+        ContentChunk.objects.create(document=self.document, chunk_index=0, content_type=ContentChunk.TEXT,
+                                    content='Tides are explained here.', metadata={'page_number': 1})
+        self.client = APIClient()
+        self.client.force_authenticate(self.document.user)
+
+    def reprocess(self, reading_mode):
+        return self.client.post(f'/api/documents/{self.document.id}/reprocess/', {'reading_mode': reading_mode},
+                                format='json')
+
+    def test_reprocess_is_refused_while_a_job_is_running(self):
+        enqueue_document(self.document)
+        IngestionJob.objects.update(status=IngestionJob.RUNNING)
+
+        self.assertEqual(self.reprocess('story').status_code, 409)
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.reading_mode, self.document.chunks.count()), ('direct', 1))
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    def test_reprocess_reuses_a_waiting_job(self):
+        enqueue_document(self.document)
+
+        self.assertEqual(self.reprocess('story').status_code, 202)
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.reading_mode, self.document.chunks_ready), ('story', 0))
+        self.assertFalse(self.document.chunks.exists())
+        self.assertEqual(IngestionJob.objects.count(), 1)
+
+    def test_worker_does_not_overwrite_a_new_reading_mode(self):
+        processor = PDFProcessor(self.document.id)
+        Document.objects.filter(id=self.document.id).update(reading_mode='story')
+        processor.process_document()
+
+        self.document.refresh_from_db()
+        self.assertEqual((self.document.status, self.document.reading_mode), (Document.COMPLETED, 'story'))
+
+
+@override_settings(AI_CACHE_ENABLED=False, AI_REQUESTS_PER_MINUTE=0, AI_TOKENS_PER_MINUTE=0, AI_MAX_RETRIES=0)
+class BatchStoryTests(TestCase):
+
+    def setUp(self):
+        reset_ai_singletons()
+        self.addCleanup(reset_ai_singletons)
+        self.backend = FakeBackend(latency_ms=0, latency_distribution='fixed')
+        self.transformer = AIStoryTransformer(backend=self.backend)
+
+    def parse(self, response, expected=3):
+        return self.transformer.parse_batch_response(response, expected)
+
+    def test_sections_are_matched_by_id_not_position(self):
+        response = json.dumps([{'id': 2, 'story': 'C'}, {'id': 0, 'story': 'A'}, {'id': 1, 'story': ' B '}])
+        self.assertEqual(self.parse(f'Here you go:\n{response}\nEnjoy!'), ['A', 'B', 'C'])
+
+    def test_missing_extra_and_malformed_items_are_ignored(self):
+        response = json.dumps([
+            {'id': 0, 'story': 'A'}, {'id': 5, 'story': 'out of range'}, {'id': '1', 'story': 'string id'},
+            {'id': 2, 'story': '   '}, 'not an object', {'id': 0},
+        ])
+        self.assertEqual(self.parse(response), ['A', None, None])
+
+    def test_unparseable_response_covers_no_section(self):
+        for response in ['[{"id": 0, "story": "A"', 'no json here', self.transformer.create_fallback()]:
+            with self.subTest(response=response):
+                self.assertEqual(self.parse(response), [None, None, None])
+
+    def test_complete_batch_takes_one_request(self):
+        with mock.patch.object(self.backend, 'render', wraps=self.backend.render) as render:
+            stories = self.transformer.transform_sections_batch(['Section A', 'Section B', 'Section C'], ['science'])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(set(stories)), 3)
+        self.assertNotIn(self.transformer.create_fallback(), stories)
+
+    def test_uncovered_sections_fall_back_to_single_requests(self):
+        replies = [json.dumps([{'id': 2, 'story': 'Story C'}, {'id': 0, 'story': 'Story A'}]), 'Story B']
+        with mock.patch.object(self.backend, 'render', side_effect=replies) as render:
+            stories = self.transformer.transform_sections_batch(
+                ['Section A text', 'Section B text', 'Section C text'], ['science']
+            )
+
+        self.assertEqual(stories, ['Story A', 'Story B', 'Story C'])
+        prompts = [call.args[0] for call in render.call_args_list]
+        self.assertEqual(len(prompts), 2)
+        self.assertIn('### SECTION 2 ###', prompts[0])
+        self.assertIn('Section B text', prompts[1])
+        self.assertNotIn('### SECTION', prompts[1])
+
+    def test_rejected_batch_request_falls_back_for_every_section(self):
+        with mock.patch.object(self.backend, 'render', side_effect=[ValueError('bad request'), 'Story A', 'Story B']):
+            stories = self.transformer.transform_sections_batch(['Section A text', 'Section B text'], ['science'])
+        self.assertEqual(stories, ['Story A', 'Story B'])
+
+
+class TokenBucketLimiterTests(SimpleTestCase):
+    """Two limiters on one state file stand in for two processes"""
+
+    def setUp(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_path = os.path.join(state_dir.name, 'ratelimit.json')
+
+    def limiter(self, requests_per_minute=60, tokens_per_minute=0):
+        return TokenBucketLimiter(requests_per_minute, tokens_per_minute, state_path=self.state_path)
+
+    def test_processes_draw_from_one_quota(self):
+        first, second = self.limiter(), self.limiter()
+        for _ in range(60):
+            self.assertEqual(first.try_acquire(1), 0)
+        self.assertAlmostEqual(second.try_acquire(1), 1, places=1)
+
+    def test_tokens_refill_over_time(self):
+        limiter = self.limiter(requests_per_minute=0, tokens_per_minute=600)
+        self.assertEqual(limiter.try_acquire(600), 0)
+        self.assertAlmostEqual(limiter.try_acquire(100), 10, places=1)
+        with mock.patch('documents.ai_resilience.time.time', return_value=time.time() + 10):
+            self.assertEqual(limiter.try_acquire(100), 0)
+
+    def test_bulk_leaves_reserve_for_interactive_calls(self):
+        worker, web = self.limiter(), self.limiter()
+        for _ in range(48):
+            self.assertEqual(worker.try_acquire(1, reserve=0.2, bulk=True), 0)
+        self.assertGreater(worker.try_acquire(1, reserve=0.2, bulk=True), 0)
+        self.assertEqual(web.try_acquire(1), 0)
+
+    def test_waiting_interactive_call_holds_bulk_in_other_processes(self):
+        worker, web = self.limiter(), self.limiter()
+        while not web.try_acquire(1):
+            pass
+        self.assertTrue(worker.stats()['interactive_waiting'])
+        with mock.patch('documents.ai_resilience.time.time', return_value=time.time() + 1.2):
+            # The bucket has refilled one request, but it is left for the interactive waiter
+            self.assertGreater(worker.try_acquire(1, bulk=True), 0)
+            self.assertEqual(web.try_acquire(1), 0)
+
+    def test_interactive_call_that_will_give_up_does_not_hold_bulk(self):
+        worker, web = self.limiter(), self.limiter()
+        while not web.try_acquire(1, hold_within=0):
+            pass
+        self.assertFalse(worker.stats()['interactive_waiting'])
+
+    def test_acquire_gives_up_when_the_wait_exceeds_max_wait(self):
+        limiter = self.limiter()
+        for _ in range(60):
+            limiter.acquire(1, max_wait=0)
+        with self.assertRaises(AIUnavailableError) as raised:
+            limiter.acquire(1, max_wait=0.5)
+        self.assertGreater(raised.exception.retry_after, 0.5)
+
+    def test_disabled_limiter_never_waits(self):
+        limiter = self.limiter(requests_per_minute=0)
+        for _ in range(100):
+            limiter.acquire(1000, max_wait=0)
+        self.assertFalse(os.path.exists(self.state_path))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('documents.ai_resilience.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def open_breaker(self):
+        for _ in range(2):
+            self.breaker.before_call()
+            self.breaker.record_failure()
+
+    def test_opens_after_threshold_failures(self):
+        self.open_breaker()
+        with self.assertRaises(AIUnavailableError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_after, 60)
+
+    def test_lets_one_trial_through_after_reset_timeout(self):
+        self.open_breaker()
+        self.now += 61
+        self.breaker.before_call()
+        with self.assertRaises(AIUnavailableError):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        self.open_breaker()
+        self.now += 61
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(AIUnavailableError):
+            self.breaker.before_call()
+
+
+class AISchedulerTests(SimpleTestCase):
+
+    def queue(self, scheduler, priority, user_key):
+        ticket = ai_scheduler._Ticket(priority, user_key)
+        scheduler._queues[priority].setdefault(user_key, deque()).append(ticket)
+        return ticket
+
+    def grant_order(self, scheduler):
+        order = []
+        while (ticket := scheduler._next_ticket()) is not None:
+            order.append((ticket.priority, ticket.user_key))
+        return order
+
+    def test_interactive_first_then_round_robin_per_user(self):
+        scheduler = ai_scheduler.AIScheduler(max_in_flight=4, interactive_reserve=1)
+        for user_key in ('a', 'a', 'a', 'b'):
+            self.queue(scheduler, ai_scheduler.BULK, user_key)
+        for user_key in ('c', 'c', 'd'):
+            self.queue(scheduler, ai_scheduler.INTERACTIVE, user_key)
+
+        self.assertEqual(self.grant_order(scheduler), [
+            ('interactive', 'c'), ('interactive', 'd'), ('interactive', 'c'),
+            ('bulk', 'a'), ('bulk', 'b'), ('bulk', 'a'), ('bulk', 'a'),
+        ])
+
+    def test_bulk_cannot_take_reserved_slots(self):
+        scheduler = ai_scheduler.AIScheduler(max_in_flight=2, interactive_reserve=1)
+        scheduler.acquire(ai_scheduler.BULK, 'a')
+        with self.assertRaises(AIUnavailableError):
+            scheduler.acquire(ai_scheduler.BULK, 'a', max_wait=0.05)
+        scheduler.acquire(ai_scheduler.INTERACTIVE, 'b', max_wait=0)
+
+        stats = scheduler.stats()['classes']
+        self.assertEqual((stats['bulk']['in_flight'], stats['bulk']['timed_out']), (1, 1))
+        self.assertEqual(stats['interactive']['in_flight'], 1)
+
+
+class ModelRouterTests(SimpleTestCase):
+
+    def router(self, **options):
+        tiers = {tier: FakeBackend(model_name=f'fake-{tier}') for tier in ('fast', 'standard')}
+        return ModelRouter(tiers, **{
+            'routes': {'story': 'standard', 'summary': 'fast'},
+            'default_tier': 'standard',
+            'small_input_tokens': 200,
+            'min_samples': 3,
+            **options,
+        })
+
+    def route(self, router, prompt_type, input_tokens):
+        route = router.route(prompt_type, input_tokens)
+        return route.tier, route.reason
+
+    def test_prompt_type_picks_its_configured_tier(self):
+        router = self.router()
+        self.assertEqual(self.route(router, 'story', 1000), ('standard', TASK))
+        self.assertEqual(self.route(router, 'summary', 1000), ('fast', TASK))
+        self.assertEqual(self.route(router, 'other', 1000), ('standard', TASK))
+
+    def test_small_inputs_go_to_the_fastest_tier(self):
+        route = self.router().route('story', 150)
+        self.assertEqual((route.tier, route.backend.model_name, route.reason), ('fast', 'fake-fast', SMALL_INPUT))
+
+    def test_slow_tier_falls_back_until_its_samples_expire(self):
+        router = self.router(latency_slo_ms={'story': 1000}, window_seconds=60)
+        now = 1000.0
+        with mock.patch('documents.model_router.time.monotonic', side_effect=lambda: now):
+            for _ in range(3):
+                router.observe('standard', 2.5)
+            self.assertEqual(self.route(router, 'story', 1000), ('fast', SLO_FALLBACK))
+            now += 61
+            self.assertEqual(self.route(router, 'story', 1000), ('standard', TASK))
+        self.assertEqual(router.stats()['fast']['decisions'], {SLO_FALLBACK: 1})
+
+    @override_settings(AI_BACKEND='fake', AI_MODEL_TIERS={'fast': 'x', 'standard': 'y'},
+                       AI_FAKE_TIER_LATENCY_MS={'fast': 0, 'standard': 0})
+    def test_fake_tiers_from_settings(self):
+        transformer = AIStoryTransformer()
+        self.assertEqual({tier: backend.model_name for tier, backend in transformer.router.tiers.items()},
+                         {'fast': 'fake-fast', 'standard': 'fake-standard'})
+
+
+class JobTimeoutTests(FakeAITestCase):
+    ai_settings = {'AI_FAKE_LATENCY_MS': 300, 'AI_MAX_CONCURRENCY': 1}
+
+    def test_timed_out_job_is_requeued_without_fallback_chunks(self):
+        document = create_document(reading_mode='story', status=Document.COMPLETED,
+                                   metadata={'story_generation': 'lazy'})
+        self.create_pending_chunks(document, 8)
+        job = enqueue_document(document, IngestionJob.PREFETCH_STORY, {'start': 0, 'count': 8})
+        job.timeout_seconds = 1
+        job.save(update_fields=['timeout_seconds'])
+
+        worker = IngestionWorker(name='test')
+        worker.run_job(worker.claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.QUEUED)
+        self.assertIn('Timed out', job.last_error)
+        fallback = ai_provider.get_ai_transformer().create_fallback()
+        self.assertFalse(document.chunks.filter(content=fallback).exists())
+        self.assertEqual(document.chunks.filter(metadata__story_status='pending').count(), 8)
+
+
+class ResponseCacheTests(FakeAITestCase):
+    ai_settings = {'AI_CACHE_ENABLED': True}
+
+    def test_locked_database_does_not_fail_cache_reads(self):
+        cache = ai_cache.get_response_cache()
+        cache.set('fake-model', 'prompt', 'response')
+        cache._memory.clear()  # force the lookup through the DB tier
+
+        # SQLite under concurrent ingestion threads: the hit counter update fails with "database is locked"
+        with mock.patch.object(QuerySet, 'update', side_effect=OperationalError('database is locked')):
+            self.assertEqual(cache.get('fake-model', 'prompt'), 'response')
+        self.assertEqual(AIResponseCacheEntry.objects.get().hits, 0)
+
+    def test_locked_database_does_not_fail_cache_eviction(self):
+        cache = ai_cache.get_response_cache()
+        cache.evict_every = 1
+        with mock.patch.object(QuerySet, 'delete', side_effect=OperationalError('database is locked')):
+            cache.set('fake-model', 'prompt', 'response')
+        self.assertEqual(cache.get('fake-model', 'prompt'), 'response')
+        self.assertEqual(AIResponseCacheEntry.objects.count(), 1)
+
+    def test_locked_database_does_not_fail_story_store_reads(self):
+        key = {'section_hash': 'abc', 'primary_interest': 'science', 'reading_level': 'casual', 'prompt_version': 1}
+        store_story(key, 'A stored story.')
+        with mock.patch.object(QuerySet, 'update', side_effect=OperationalError('database is locked')):
+            self.assertEqual(find_stored_story(key), 'A stored story.')
+        with mock.patch.object(QuerySet, 'first', side_effect=OperationalError('database is locked')):
+            self.assertIsNone(find_stored_story(key))
+
+
+class AIProviderTests(FakeAITestCase):
+    def test_lookups_are_counted_from_every_thread(self):
+        before = ai_provider.provider_stats()['lookups']
+        threads = [threading.Thread(target=lambda: [ai_provider.get_ai_transformer() for _ in range(200)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(ai_provider.provider_stats()['lookups'] - before, 1600)
+
+    def test_fork_hook_does_not_wait_for_a_held_lock(self):
+        transformer = ai_provider.get_ai_transformer()
+        held = ai_provider._lock
+        self.addCleanup(setattr, ai_provider, '_lock', held)
+        # Another thread of the parent was inside the lock when it forked
+        with held:
+            ai_provider._reset_after_fork()
+        self.assertIsNot(ai_provider._lock, held)
+        self.assertIsNot(ai_provider.get_ai_transformer(), transformer)
+
+
+class AICallRecorderTests(TestCase):
+    def record(self, recorder):
+        recorder.record(AICallRecord.STORY, 'fake-model', AICallRecord.SUCCESS, 0.1)
+
+    def test_records_past_retention_are_pruned(self):
+        old = AICallRecord.objects.create(prompt_type=AICallRecord.STORY, model_name='fake-model',
+                                          outcome=AICallRecord.SUCCESS, created_at=timezone.now() - timedelta(days=40))
+        recorder = ai_metrics.AICallRecorder(flush_size=1, retention_days=30, prune_every=2)
+        self.record(recorder)
+        self.assertTrue(AICallRecord.objects.filter(id=old.id).exists())
+
+        self.record(recorder)
+        self.assertFalse(AICallRecord.objects.filter(id=old.id).exists())
+        self.assertEqual(AICallRecord.objects.count(), 2)
+
+    def test_failed_prune_keeps_the_flushed_records(self):
+        recorder = ai_metrics.AICallRecorder(flush_size=1, retention_days=30, prune_every=1)
+        with mock.patch.object(recorder, 'prune', side_effect=OperationalError('database is locked')):
+            self.record(recorder)
+        self.assertEqual(AICallRecord.objects.count(), 1)
+
+
+class StoryStoreMetricsTests(FakeAITestCase):
+    ai_settings = {'AI_METRICS_ENABLED': True}
+
+    def test_stored_story_is_recorded_as_cache_hit(self):
+        transformer = ai_provider.get_ai_transformer()
+        text = 'Rivers carve valleys over thousands of years as water wears the rock away.'
+        first = transformer.transform_to_story(text, ['science'], 'casual')
+        self.assertEqual(transformer.transform_to_story(text, ['science'], 'casual'), first)
+
+        ai_metrics.get_call_recorder().flush()
+        outcomes = list(AICallRecord.objects.filter(prompt_type=AICallRecord.STORY).values_list('outcome', flat=True))
+        self.assertEqual(sorted(outcomes), [AICallRecord.CACHE_HIT, AICallRecord.SUCCESS])
+
+
+class DocumentSummaryTests(FakeAITestCase):
+    def test_chunk_summary_keeps_a_story_filled_meanwhile(self):
+        document = create_document(reading_mode='story')
+        self.create_pending_chunks(document, 2)
+        summarizer = DocumentSummarizer(document, max_in_flight=1)
+        generate_summary = summarizer.ai_transformer.generate_summary
+
+        def fill_story_first(text, words):
+            # The reader opens the chunk while its summary is being generated
+            chunk = document.chunks.get(metadata__source_text=text)
+            save_streamed_story(chunk.id, f'A story about {text}')
+            return generate_summary(text, words)
+
+        with mock.patch.object(summarizer.ai_transformer, 'generate_summary', side_effect=fill_story_first):
+            summarizer.map_chunks()
+
+        for chunk in document.chunks.all():
+            self.assertEqual(chunk.metadata['story_status'], 'generated')
+            self.assertTrue(chunk.content.startswith('A story about'))
+            self.assertIn('text', chunk.metadata['summary'])
+        self.assertEqual(summarizer.generated['chunks'], 2)
+
+
+class EnhancementTests(FakeAITestCase):
+    def test_fallback_part_is_reported_missing_and_not_stored(self):
+        document = create_document()
+        chunk = ContentChunk.objects.create(document=document, chunk_index=0, content_type=ContentChunk.TEXT,
+                                            content='Tides follow the moon.', metadata={'page_number': 1})
+        transformer = ai_provider.get_ai_transformer()
+        with mock.patch.object(transformer, 'highlight_connections', return_value=transformer.create_fallback()):
+            enhancement, missing = get_or_create_enhancement(chunk, ['science'], 'casual', timeout=5)
+
+        self.assertEqual(missing, ['connections'])
+        self.assertEqual(enhancement.connections, '')
+        self.assertTrue(enhancement.enhanced_content)
+        self.assertFalse(ChunkEnhancement.objects.exists())
+
+
+class BoilerplateDetectorTests(SimpleTestCase):
+
+    def detector_for(self, pages, **options):
+        detector = BoilerplateDetector(**options)
+        for text in pages:
+            detector.observe(text)
+        return detector
+
+    def report_page(self, number):
+        return '\n'.join([
+            'ACME Corp Annual Report 2023',
+            f'Paragraph about quarter {number} results and what drove them.',
+            f'Revenue {107 + number},000 {200 + number * 3},050',
+            f'Net income {number}.3%',
+            f'Page {number} of 10',
+        ])
+
+    def test_headers_and_page_numbers_are_removed(self):
+        pages = [self.report_page(number) for number in range(1, 11)]
+        detector = self.detector_for(pages)
+        cleaned = detector.clean(pages[3])
+        self.assertNotIn('ACME Corp', cleaned)
+        self.assertNotIn('Page 4 of 10', cleaned)
+        self.assertIn('Paragraph about quarter 4', cleaned)
+
+    def test_numeric_table_rows_are_kept(self):
+        pages = [self.report_page(number) for number in range(1, 11)]
+        cleaned = self.detector_for(pages).clean(pages[6])
+        self.assertIn('Revenue 114,000 221,050', cleaned)
+        self.assertIn('Net income 7.3%', cleaned)
+
+    def test_line_needs_more_than_threshold_of_pages(self):
+        pages = [f'Introduction\nBody text of page {number}.' if number % 2 else f'Body text of page {number}.'
+                 for number in range(1, 11)]
+        # "Introduction" is on exactly half the pages
+        cleaned = self.detector_for(pages, threshold=0.5).clean(pages[0])
+        self.assertIn('Introduction', cleaned)
+
+    def test_short_documents_are_left_alone(self):
+        pages = [self.report_page(number) for number in range(1, 4)]
+        detector = self.detector_for(pages)
+        self.assertEqual(detector.clean(pages[0]), pages[0])
+
+
+@mock.patch('documents.pdf_processor.get_ai_transformer', mock.Mock())
+@override_settings(BOILERPLATE_SAMPLE_PAGES=10)
+class BoilerplateSampleTests(TestCase):
+    def setUp(self):
+        self.document = create_document(pages=30)
+        DocumentPage.objects.bulk_create([
+            DocumentPage(document=self.document, page_number=number,
+                         text=f'ACME Corp Annual Report\nTopic {number} is explained here.\nPage {number} of 30')
+            for number in range(1, 31)
+        ])
+
+    def test_cleaned_pages_flow_after_the_leading_sample(self):
+        processor = PDFProcessor(self.document.id)
+        iter_page_texts = processor.iter_page_texts
+        read = []
+
+        def recording_iter_page_texts(after_page=0):
+            for page_num, text in iter_page_texts(after_page):
+                read.append(page_num)
+                yield page_num, text
+
+        with mock.patch.object(processor, 'iter_page_texts', recording_iter_page_texts):
+            pages = processor.iter_clean_page_texts(after_page=2)
+            self.assertEqual(next(pages), (3, 'Topic 3 is explained here.'))
+            self.assertEqual(read, list(range(1, 11)))
+            self.assertEqual(list(pages)[-1], (30, 'Topic 30 is explained here.'))
+        self.assertEqual(read, list(range(1, 31)))
+        self.assertEqual(processor.document.metadata['boilerplate']['pages'], 10)
+
+
+class ChunkArtifactTests(FakeAITestCase):
+
+    def test_pending_story_chunks_are_skipped(self):
+        document = create_document(reading_mode='story', metadata={'story_generation': 'lazy'})
+        self.create_pending_chunks(document, 3)
+        processor = PDFProcessor(document.id)
+        processor.generate_pending_stories(0, 1)
+
+        self.assertEqual(generate_chunk_artifacts(document, 'casual'), 1)
+        self.assertEqual([bool(chunk.artifacts) for chunk in document.chunks.order_by('chunk_index')],
+                         [True, False, False])
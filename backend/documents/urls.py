@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import streaming, views
 
 router = DefaultRouter()
 router.register(r'documents', views.DocumentViewSet, basename='document')
 router.register(r'chunks', views.ContentChunkViewSet, basename='chunk')
 
 urlpatterns = [
+    path('chunks/<int:pk>/enhance/stream/', streaming.stream_chunk_enhancement, name='chunk-enhance-stream'),
+    path('chunks/<int:pk>/story/stream/', streaming.stream_chunk_story, name='chunk-story-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,15 +1,32 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Document, ContentChunk, ReadingSession, Bookmark, ReadingAnalytics
+from .models import Document, ContentChunk, ReadingSession, Bookmark, ReadingAnalytics, IngestionJob
 from .serializers import (DocumentSerializer, ContentChunkSerializer, DocumentUploadSerializer,
                          ReadingSessionSerializer, BookmarkSerializer, ReadingAnalyticsSerializer,
-                         ProgressUpdateSerializer)
-from .pdf_processor import PDFProcessor
+                         ProgressUpdateSerializer, IngestionJobSerializer)
+from .ai_context import ai_call_context
+from .ai_metrics import get_call_recorder, summarize_calls
+from .ai_provider import get_ai_transformer
+from .ai_resilience import AIUnavailableError
+from .enhancements import get_or_create_enhancement
+from .ingestion import enqueue_document, enqueue_story_prefetch
+from .storage import store_upload
 from users.learning_engine import UserLearningEngine
 
+def ai_unavailable_response(error):
+    """Distinct 503 so clients can tell a model outage apart from generated content"""
+    retry_after = int(error.retry_after or 30)
+    return Response(
+        {'status': 'ai_unavailable', 'error': str(error), 'retry_after': retry_after},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(retry_after)}
+    )
+
 class DocumentViewSet(viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     
@@ -24,30 +41,25 @@ class DocumentViewSet(viewsets.ModelViewSet):
             title = upload_serializer.validated_data.get('title') or file.name
             reading_mode = upload_serializer.validated_data.get('reading_mode', 'direct')
             
+            # Identical uploads share one stored copy, keyed by content hash
+            stored_name, content_hash = store_upload(file)
+            
             # Create the document with reading mode
             document = Document.objects.create(
                 user=request.user,
                 title=title,
                 original_filename=file.name,
-                file=file,
+                file=stored_name,
+                content_hash=content_hash,
                 file_size=file.size,
                 reading_mode=reading_mode
             )
             
-            # Process the PDF based on selected mode
-            try:
-                processor = PDFProcessor(document.id)
-                processor.process_document()
-            except Exception as e:
-                document.status = Document.FAILED
-                document.save()
-                return Response(
-                    {'error': f'Failed to process PDF: {str(e)}'}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+            # Hand off to the ingestion workers so the upload returns immediately
+            enqueue_document(document)
             
             serializer = self.get_serializer(document)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         
         return Response(upload_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -55,8 +67,14 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def chunks(self, request, pk=None):
         document = self.get_object()
         chunks = document.chunks.all()
+        if document.status != Document.COMPLETED:
+            # Serve the prefix persisted so far while ingestion continues
+            chunks = chunks.filter(chunk_index__lt=document.chunks_ready)
         serializer = ContentChunkSerializer(chunks, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={
+            'X-Document-Status': document.status,
+            'X-Chunks-Ready': str(document.chunks_ready),
+        })
     
     @action(detail=True, methods=['post'])
     def reprocess(self, request, pk=None):
@@ -70,26 +88,104 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Delete existing chunks
-        document.chunks.all().delete()
+        with transaction.atomic():
+            # Locking the waiting job keeps a worker from claiming it until the reset is committed
+            active_jobs = list(IngestionJob.objects.select_for_update().filter(
+                document=document,
+                job_type__in=[IngestionJob.PROCESS, IngestionJob.REPROCESS],
+                status__in=[IngestionJob.QUEUED, IngestionJob.RUNNING],
+            ))
+            if any(job.status == IngestionJob.RUNNING for job in active_jobs):
+                return Response(
+                    {'error': 'Document is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            # Delete existing chunks and checkpoints, then queue the rebuild
+            document.chunks.all().delete()
+            document.reading_mode = new_mode
+            document.status = Document.UPLOADED
+            document.chunks_ready = 0
+            document.checkpoint_page = 0
+            document.save()
+            
+            # A job that is still waiting picks up the new mode from the document
+            if not active_jobs:
+                enqueue_document(document, IngestionJob.REPROCESS, {'reading_mode': new_mode})
+        serializer = self.get_serializer(document)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def ingestion(self, request, pk=None):
+        """Get the ingestion job history for document"""
+        document = self.get_object()
+        jobs = document.ingestion_jobs.order_by('-created_at')
+        return Response(IngestionJobSerializer(jobs, many=True).data)
+    
+    @action(detail=True, methods=['get', 'post'])
+    def artifacts(self, request, pk=None):
+        """Get stored study artifacts for every chunk, or queue their generation with POST"""
+        document = self.get_object()
+        if request.method == 'POST':
+            job = enqueue_document(document, IngestionJob.ARTIFACTS, {
+                'reading_level': request.user.profile.reading_level,
+            })
+            return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
         
-        # Update reading mode and reprocess
-        document.reading_mode = new_mode
-        document.status = Document.PROCESSING
-        document.save()
+        chunks = document.chunks.order_by('chunk_index').values('id', 'chunk_index', 'artifacts')
+        return Response([chunk for chunk in chunks if chunk['artifacts']])
+    
+    @action(detail=True, methods=['get', 'post'])
+    def summary(self, request, pk=None):
+        """Get the stored document summary, or queue (re)generation with POST"""
+        document = self.get_object()
+        if request.method == 'POST':
+            if document.status != Document.COMPLETED:
+                return Response({'error': 'Document is still being processed'}, status=status.HTTP_409_CONFLICT)
+            job = enqueue_document(document, IngestionJob.SUMMARIZE)
+            return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
         
-        try:
-            processor = PDFProcessor(document.id)
-            processor.process_document()
-            serializer = self.get_serializer(document)
-            return Response(serializer.data)
-        except Exception as e:
-            document.status = Document.FAILED
-            document.save()
-            return Response(
-                {'error': f'Failed to reprocess PDF: {str(e)}'}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        summary = document.metadata.get('summary')
+        if not summary:
+            return Response({'status': 'not_generated'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({key: value for key, value in summary.items() if key != 'nodes'})
+    
+    @action(detail=True, methods=['get'])
+    def ingest_report(self, request, pk=None):
+        """Where ingestion time and AI spend went for this document"""
+        document = self.get_object()
+        get_call_recorder().flush()
+        jobs = [
+            {
+                'id': job.id,
+                'job_type': job.job_type,
+                'status': job.status,
+                'attempts': job.attempts,
+                'duration_seconds': (job.finished_at - job.started_at).total_seconds()
+                if job.started_at and job.finished_at else None,
+            }
+            for job in document.ingestion_jobs.order_by('created_at')
+        ]
+        return Response({
+            'document_id': document.id,
+            'status': document.status,
+            'pages': document.pages,
+            'chunks_ready': document.chunks_ready,
+            'extraction': document.metadata.get('extraction'),
+            'cloned_from': document.metadata.get('cloned_from'),
+            'jobs': jobs,
+            'ai': summarize_calls(document.ai_calls.all()),
+        })
+    
+    @action(detail=True, methods=['post'])
+    def enhancements(self, request, pk=None):
+        """Queue background generation of enhancements for every chunk, for this reader's profile"""
+        document = self.get_object()
+        job = enqueue_document(document, IngestionJob.ENHANCE, {
+            'interests': request.user.profile.interests,
+            'reading_level': request.user.profile.reading_level,
+        })
+        return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['get', 'post'])
     def progress(self, request, pk=None):
@@ -114,6 +210,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 session.save()
                 self._update_analytics(request.user, document, session)
                 
+                # Lazy story documents generate the next few stories just ahead of the reader
+                if document.metadata.get('story_generation') == 'lazy':
+                    enqueue_story_prefetch(document, session.current_chunk)
+                
                 # Learn from user behavior
                 learner = UserLearningEngine(request.user)
                 learner.learn_from_session(session)
@@ -164,10 +264,13 @@ class DocumentViewSet(viewsets.ModelViewSet):
             user_interests = request.user.profile.interests
             reading_history = Document.objects.filter(user=request.user).values_list('title', flat=True)[:5]
             
-            ai_transformer = AIStoryTransformer()
-            recommendations = ai_transformer.generate_recommendations(user_interests, list(reading_history))
+            ai_transformer = get_ai_transformer()
+            with ai_call_context(user_id=request.user.id):
+                recommendations = ai_transformer.generate_recommendations(user_interests, list(reading_history))
             
             return Response({'recommendations': recommendations})
+        except AIUnavailableError as e:
+            return ai_unavailable_response(e)
         except Exception as e:
             return Response({'recommendations': 'Explore documents in your areas of interest for personalized suggestions.'})
     
@@ -194,6 +297,14 @@ class ContentChunkViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return ContentChunk.objects.filter(document__user=self.request.user)
     
+    @action(detail=True, methods=['get'])
+    def artifacts(self, request, pk=None):
+        """Get the chunk's summary, key points, questions and reading-level rewrite"""
+        chunk = self.get_object()
+        if not chunk.artifacts:
+            return Response({'status': 'not_generated'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(chunk.artifacts)
+    
     @action(detail=True, methods=['get'])
     def enhance(self, request, pk=None):
         """Get enhanced version of chunk with contextual explanations"""
@@ -202,20 +313,27 @@ class ContentChunkViewSet(viewsets.ReadOnlyModelViewSet):
             user_interests = request.user.profile.interests
             reading_level = request.user.profile.reading_level
             
-            ai_transformer = AIStoryTransformer()
-            enhanced_content = ai_transformer.add_contextual_enhancements(
-                chunk.content, user_interests, reading_level
-            )
-            connections = ai_transformer.highlight_connections(chunk.content, user_interests)
+            # Generated once per chunk, interests and reading level, then served from the DB
+            with ai_call_context(document_id=chunk.document_id, user_id=request.user.id):
+                enhancement, missing = get_or_create_enhancement(
+                    chunk, user_interests, reading_level,
+                    timeout=getattr(settings, 'AI_ENHANCE_DEADLINE', 20)
+                )
             
             return Response({
                 'original_content': chunk.content,
-                'enhanced_content': enhanced_content,
-                'connections': connections
+                'enhanced_content': enhancement.enhanced_content or chunk.content,
+                'connections': enhancement.connections or 'Unable to generate connections at this time.',
+                'partial': bool(missing),
+                'missing': missing
             })
+        except AIUnavailableError as e:
+            return ai_unavailable_response(e)
         except Exception as e:
             return Response({
                 'original_content': chunk.content,
                 'enhanced_content': chunk.content,
-                'connections': 'Unable to generate connections at this time.'
+                'connections': 'Unable to generate connections at this time.',
+                'partial': True,
+                'missing': ['enhanced_content', 'connections']
             })
\ No newline at end of file